@@ -1,7 +1,15 @@
-from .pdb import PDBHelixLine, PDBAtomLine, parse_pdb_HELIX_line, \
+from .pdb import PDBHelixLine, PDBAtomLine, PDBAtomTable, parse_pdb_HELIX_line, \
+	iter_pdb_tables, iter_pdb_models, LazyPDBAtomLine, MappedPDBFile, \
 	parse_pdb_ATOM_line, print_pdb_ATOM_line, \
-	get_pdb_resolution_from_web, pdb_rsln, PDBAtom, PDBResidue, PDBProtein
-from .funcs import parse_prot_cntct_line, float_list, get_ranges, ContactEnd, \
-unionize_distro_given_x, unionize_2_distros, InterresidueContact
-from .constants import aminoacids, Receptor
+	get_pdb_resolution_from_web, fetch_pdb_resolutions, pdb_rsln, pdb_rsln_many, \
+	ResolutionStore, resolution_store, \
+	PDBAtom, PDBResidue, PDBProtein, CellList, Selection, \
+	PDBTrajectory, format_pdb_records, write_pdb, PDBLoadResult, load_pdb_files, load_pdb_sequences, \
+	read_pdb_table
+from .funcs import parse_prot_cntct_line, parse_prot_cntct_report, read_prot_cntct_report, \
+	iter_prot_cntct_report, float_list, get_ranges, IntervalSet, get_interval_set, ContactEnd, \
+unionize_distro_given_x, unionize_2_distros, unionize_distros, InterresidueContact, \
+	InteractionPairHistogram, count_interaction_pairs
+from .constants import aminoacids, AminoAcid, Receptor, load_receptors, load_receptor_residues, \
+	amino_acid_codes, amino_acid_letters_of, amino_acid_groups_of
 from .gromacs import add_group_to_index, run_async_shell_cmd
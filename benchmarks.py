@@ -0,0 +1,258 @@
+'''Benchmarks for the pdb parsing and storage of bioinf
+
+Run with
+
+python -m bioinf.benchmarks
+
+Memory per atom (memory_per_atom, 100000 atoms, CPython 3.11, numpy 2.4):
+
+                          PDBProtein objects    PDBAtomTable
+before slots/categories       956 bytes          142 bytes
+after                         628 bytes           67 bytes
+
+PDBProtein objects were slimmed by __slots__ on PDBAtomLine, PDBAtom and
+PDBResidue and by interning their repeated fields; PDBAtomTable by storing
+its string columns as uint8/uint16 codes into their distinct values.
+
+PDBProtein of 200000 atoms (protein_build_time):
+
+from lines (PDBAtomLine.parse_string per line)      1.9 s
+from table (parse_string and from_table)            1.2 s
+
+from_table converts each table column to strings at once and formats the 
+coordinates of a line only when they are used.
+
+Resolution extraction per structure page (resolution_extraction_time,
+synthetic 370 kB pages, 64 kB chunks):
+
+BeautifulSoup/lxml DOM                  536 ms
+incremental scan                          0.2 ms
+
+The scan reads the page only up to the resolution element and builds no
+tree; BeautifulSoup is imported only when a page needs it as a fallback.
+
+Union of distributions on a common x axis (distribution_union_time, 100
+distributions of about 1600 distinct x's in 2000 bins):
+
+100 distributions, comparing every x with the union     825 ms
+100 distributions, unionize_distro_given_x each          36 ms
+100 distributions, unionize_distros                      30 ms
+2 distributions, comparing every x                       16 ms
+2 distributions, unionize_2_distros                       0.6 ms
+
+float_list of 500000 xvg-formatted values (float_list_time):
+
+                              element by element    float_list
+strings                             576 ms            119 ms
+strings with one 'pi'               583 ms            123 ms
+string array                       2114 ms            189 ms
+floats                              268 ms             56 ms
+
+float_list converts chunks of 4096 values at once and goes element by
+element only through the chunks holding 'pi', 'e' or complex values.
+
+'''
+
+import gc
+import glob
+import os.path
+import time
+import tracemalloc
+
+import numpy as np
+
+from .funcs import float_list, _float_of, unionize_distro_given_x, unionize_2_distros, unionize_distros
+from .pdb import PDBAtomLine, PDBAtomTable, PDBProtein, _resolution_from_chunks, \
+    _resolution_from_page
+
+
+_RESIDUES = (
+    ('ALA', ('N', 'CA', 'C', 'O', 'CB', 'H')),
+    ('GLY', ('N', 'CA', 'C', 'O', 'H')),
+    ('SER', ('N', 'CA', 'C', 'O', 'CB', 'OG', 'H', 'HG')),
+    ('LEU', ('N', 'CA', 'C', 'O', 'CB', 'CG', 'CD1', 'CD2', 'H')),
+)
+
+
+def synthetic_pdb_text(atom_count, seed=0):
+    """Return the text of a pdb file of atom_count atoms in residues of
+    four kinds, split into chains of 1000 residues"""
+    random = np.random.default_rng(seed)
+    coordinates = random.uniform(-100, 100, (atom_count, 3))
+    lines = []
+    residue = 0
+    while len(lines) < atom_count:
+        resName, names = _RESIDUES[residue % len(_RESIDUES)]
+        chainID = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'[(residue // 1000) % 26]
+        for name in names[:atom_count - len(lines)]:
+            x, y, z = coordinates[len(lines)]
+            lines.append(str(PDBAtomLine(f'{len(lines) % 99999 + 1}', name, '',
+                resName, chainID, f'{residue % 1000 + 1}', '', f'{x:.3f}',
+                f'{y:.3f}', f'{z:.3f}', '1.00', f'{random.uniform(0, 99):.2f}',
+                name[0], '')))
+        residue += 1
+    return '\n'.join(lines) + '\n'
+
+
+def _traced_bytes(build):
+    gc.collect()
+    tracemalloc.start()
+    built = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, built
+
+
+def memory_per_atom(atom_count=100000):
+    """Return the bytes per atom held by a PDBProtein (with its coordinates
+    parsed) and by a PDBAtomTable of the same atoms"""
+    text = synthetic_pdb_text(atom_count)
+    lines = text.splitlines()
+
+    def build_protein():
+        protein = PDBProtein([PDBAtomLine.parse_string(line) for line in lines])
+        for atom in protein.atoms:
+            atom.r
+        return protein
+
+    protein_size, _ = _traced_bytes(build_protein)
+    table_size, _ = _traced_bytes(lambda: PDBAtomTable.parse_string(text))
+    return {'PDBProtein': protein_size / atom_count, 'PDBAtomTable': table_size / atom_count}
+
+
+def protein_build_time(atom_count=200000):
+    """Return the seconds taken to build the PDBProtein of a file of 
+    atom_count atoms from its lines and through a PDBAtomTable"""
+    text = synthetic_pdb_text(atom_count)
+    lines = text.splitlines()
+    times = {}
+    for name, build in [
+        ('from lines', lambda: PDBProtein([PDBAtomLine.parse_string(line) for line in lines])),
+        ('from table', lambda: PDBProtein.from_table(PDBAtomTable.parse_string(text)))]:
+        start = time.perf_counter()
+        build()
+        times[name] = time.perf_counter() - start
+    return times
+
+
+def synthetic_structure_page(resolution='2.40', size=300000, seed=0):
+    """Return the bytes of a page shaped like an rcsb.org structure page: a
+    long head of scripts, the experiment header and a long body of tables"""
+    random = np.random.default_rng(seed)
+    script = ''.join(f'var v{i} = {random.uniform(0, 9):.3f};' for i in range(size // 40))
+    rows = ''.join(f'<tr><td class="c">{random.uniform(0, 9):.2f}</td></tr>'
+        for i in range(size // 40))
+    return (f'<!DOCTYPE html><html><head><script>{script}</script></head><body>'
+        '<ul id="exp_header_0">'
+        '<li id="exp_header_0_method"><strong>Method:</strong>&nbsp;X-RAY DIFFRACTION</li>'
+        f'<li id="exp_header_0_resolution"><strong>Resolution:</strong>&nbsp;{resolution}'
+        f' &Aring;</li></ul><table>{rows}</table></body></html>').encode('utf-8')
+
+
+def resolution_extraction_time(pages_dir=None, chunk_size=65536, repeat=5):
+    """Return the milliseconds per page taken to find the resolution by the
+    BeautifulSoup parser and by the incremental scan, over the *.html pages
+    saved in pages_dir or over synthetic ones"""
+    if pages_dir is None:
+        pages = [synthetic_structure_page(f'{1 + i / 10:.2f}', seed=i) for i in range(10)]
+    else:
+        pages = []
+        for path in sorted(glob.glob(os.path.join(pages_dir, '*.html'))):
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+
+    def chunks(page):
+        return (page[i:i + chunk_size] for i in range(0, len(page), chunk_size))
+
+    times = {}
+    for name, extract in [
+        ('BeautifulSoup/lxml DOM', lambda page: _resolution_from_page(page.decode('utf-8'))),
+        ('incremental scan', lambda page: _resolution_from_chunks(chunks(page)))]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for page in pages:
+                extract(page)
+        times[name] = (time.perf_counter() - start) * 1000 / repeat / len(pages)
+    return times
+
+
+def _unionize_distro_given_x_by_comparison(cmbn_x, x, y):
+    # unionize_distro_given_x before it used searchsorted
+    cmbn_y = np.zeros(len(cmbn_x))
+    for i, j in enumerate(x):
+        cmbn_y[j == cmbn_x] = y[i]
+    return cmbn_y
+
+
+def distribution_union_time(distro_count=100, bins=2000, seed=0):
+    """Return the seconds taken to put distro_count distributions of about 
+    bins x's each on their common x axis, by comparing every x with the 
+    union (as unionize_distro_given_x did), by unionize_distro_given_x and 
+    by unionize_distros, and for two of them by unionize_2_distros"""
+    random = np.random.default_rng(seed)
+    xs = [np.unique(random.integers(0, 2 * bins, bins)) * 0.5 for _ in range(distro_count)]
+    ys = [random.uniform(0, 1, len(x)) for x in xs]
+    cmbn_x = np.unique(np.concatenate(xs))
+
+    def timed(function):
+        start = time.perf_counter()
+        function()
+        return time.perf_counter() - start
+
+    return {
+        'comparing every x': timed(lambda: [_unionize_distro_given_x_by_comparison(cmbn_x, x, y) 
+            for x, y in zip(xs, ys)]),
+        'unionize_distro_given_x': timed(lambda: [unionize_distro_given_x(cmbn_x, x, y) 
+            for x, y in zip(xs, ys)]),
+        'unionize_distros': timed(lambda: unionize_distros(xs, ys)),
+        'two by comparing every x': timed(lambda: [_unionize_distro_given_x_by_comparison(
+            np.unique(np.append(xs[0], xs[1])), x, y) for x, y in zip(xs[:2], ys[:2])]),
+        'unionize_2_distros': timed(lambda: unionize_2_distros(xs[0], ys[0], xs[1], ys[1])),
+    }
+
+
+def _float_list_by_element(listFloats):
+    # float_list before its bulk conversion
+    floats = np.empty(len(listFloats))
+    for i in range(len(listFloats)):
+        floats[i] = _float_of(listFloats, i)
+    return floats
+
+
+def float_list_time(count=500000, seed=0):
+    """Return the milliseconds taken to convert count xvg-formatted strings
+    (as a list, with one 'pi' among them, and as an array) and count floats 
+    element by element, as float_list did, and by float_list"""
+    random = np.random.default_rng(seed)
+    strings = [f'{x:12.6f}' for x in random.uniform(-1000, 1000, count)]
+    inputs = {
+        'strings': strings,
+        'strings and a pi': strings[:count // 2] + ['pi'] + strings[count // 2 + 1:],
+        'string array': np.array(strings),
+        'floats': [float(x) for x in strings],
+    }
+    times = {}
+    for name, values in inputs.items():
+        for method, convert in [('by element', _float_list_by_element), ('', float_list)]:
+            start = time.perf_counter()
+            convert(list(values) if isinstance(values, list) else values.copy())
+            times[f'{name} {method}'.strip()] = (time.perf_counter() - start) * 1000
+    return times
+
+
+def _report(name, values, unit):
+    print(f'{name}:')
+    for key, value in values.items():
+        print(f'    {key:30s} {value:10.3f} {unit}')
+
+
+def main():
+    _report('memory per atom', memory_per_atom(), 'bytes')
+    _report('protein of 200000 atoms', protein_build_time(), 's')
+    _report('resolution extraction per page', resolution_extraction_time(), 'ms')
+    _report('union of 100 distributions of 2000 bins', distribution_union_time(), 's')
+    _report('float_list of 500000 values', float_list_time(), 'ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from numpy import array
+import numpy as np
 
 # An array with the aliases for the 20 common amino acids in proteins.
 # Last element for each amino acid is it's group as designated in 
@@ -74,14 +75,79 @@ class AminoAcid(AminoAcidPrimitive):
 
      @staticmethod
      def by_abbr(abbr):
-          assert isinstance(abbr, basestring)
-          return AminoAcid._by_abbr[abbr.upper()]
+          assert isinstance(abbr, str)
+          try:
+               return AminoAcid._by_abbr[abbr]
+          except KeyError:
+               return AminoAcid._by_abbr[abbr.upper()]
+
+     @staticmethod
+     def by_code(code):
+          return AminoAcid._all_values[code]
 
      @staticmethod   
      def by_letter(letter):
         assert isinstance(letter, str)
         return AminoAcid._by_letter[letter.upper()]
 
+# Integer codes of the amino acids are their rows in aminoacids; the tables 
+# below are indexed by code, with a last entry for residues that are none of 
+# the 20 (UNKNOWN_AMINO_ACID)
+UNKNOWN_AMINO_ACID = len(aminoacids)
+amino_acid_letters = np.append(aminoacids[:, 0], 'X')
+amino_acid_abbrs = np.append(aminoacids[:, 1], 'UNK')
+amino_acid_groups = np.append(aminoacids[:, 3].astype(np.int8), 0)
+
+
+
+def _name_keys(names):
+    # pack the up to 3 characters of each name into an int64 so names are 
+    # compared as numbers; longer names get the key -1
+    names = np.ascontiguousarray(names, dtype=str).reshape(-1)
+    if names.dtype.itemsize < 12:
+        names = names.astype('U3')
+    chars = names.view(np.uint32).reshape(len(names), names.dtype.itemsize // 4)
+    keys = (chars[:, 0].astype(np.int64) * 0x110000 + chars[:, 1]) * 0x110000 + chars[:, 2]
+    if chars.shape[1] > 3:
+        keys[chars[:, 3] != 0] = -1
+    return keys
+
+
+_code_keys = _name_keys(np.concatenate([aminoacids[:, 1], aminoacids[:, 0]]))
+_code_order = np.argsort(_code_keys)
+_code_keys = _code_keys[_code_order]
+_code_values = np.tile(np.arange(len(aminoacids)), 2)[_code_order]
+
+
+def _codes_for_keys(keys):
+    positions = np.minimum(np.searchsorted(_code_keys, keys), len(_code_keys) - 1)
+    found = _code_keys[positions] == keys
+    return np.where(found, _code_values[positions], UNKNOWN_AMINO_ACID).astype(np.int8), found
+
+
+def amino_acid_codes(names):
+    """Return the integer codes of an array of amino acid abbreviations 
+    ('ALA') or letters ('A'), UNKNOWN_AMINO_ACID for other names"""
+    names = np.asarray(names, dtype=str)
+    codes, found = _codes_for_keys(_name_keys(names))
+    if not found.all():
+        # lower case names are rare; look them up again upper cased
+        codes[~found], _ = _codes_for_keys(_name_keys(np.char.upper(names.reshape(-1)[~found])))
+    return codes.reshape(names.shape)
+
+
+def amino_acid_letters_of(names):
+    """Return the letters of an array of amino acid abbreviations, 'X' for 
+    unknown ones"""
+    return amino_acid_letters[amino_acid_codes(names)]
+
+
+def amino_acid_groups_of(names):
+    """Return the groups of an array of amino acid abbreviations, 0 for 
+    unknown ones"""
+    return amino_acid_groups[amino_acid_codes(names)]
+
+
 class Residue:
     def __init__(self, sequence_number, amino_acid, protein_segment, bw=None):
         self._sequence_number = sequence_number
@@ -99,6 +165,15 @@ class Residue:
             self._bw = None
         self._protein_segment = gpcrdb_dict.get('protein_segment', None)
 
+    @classmethod
+    def from_fields(cls, sequence_number, letter, protein_segment, bw=None):
+        residue = cls.__new__(cls)
+        residue._sequence_number = sequence_number
+        residue._amino_acid = AminoAcid.by_letter(letter)
+        residue._bw = bw
+        residue._protein_segment = protein_segment
+        return residue
+
     def __str__(self):
         return "{abbr_seq_num:s} : {bw:s}".format(abbr_seq_num = self.abbr_seq_num, bw = (self.bw or self.protein_segment))
 
@@ -110,49 +185,209 @@ class Residue:
     abbr_seq_num = property(lambda self: f'{self._amino_acid.abbr}{self._sequence_number}')
     helix = property(lambda self: self._bw.split('.')[0] if self._bw else None)
 
-from pathlib import Path
+import concurrent.futures
+import os
+import tempfile
+import threading
 import requests
 import json
 
+GPCRDB_RESIDUES_URL = 'https://gpcrdb.org/services/residues/extended/'
+
+_gpcrdb_sessions = threading.local()
+
+
+def _gpcrdb_session():
+    # one session per thread, so each worker reuses its connections
+    if not hasattr(_gpcrdb_sessions, 'session'):
+        _gpcrdb_sessions.session = requests.Session()
+    return _gpcrdb_sessions.session
+
+
+def _save_residues(path, residues):
+    # write to a temporary file first so readers never see a partial cache
+    handle, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npz')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, 
+                sequence_number=np.array([r.sequence_number for r in residues], dtype=np.int64),
+                amino_acid=np.array([r.amino_acid.letter for r in residues], dtype=str),
+                protein_segment=np.array([r.protein_segment or '' for r in residues], dtype=str),
+                bw=np.array([r.bw or '' for r in residues], dtype=str))
+        os.replace(temporary_path, path)
+    except OSError:
+        os.remove(temporary_path)
+        raise
+
+
+def _load_residues(path):
+    with np.load(path, allow_pickle=False) as arrays:
+        columns = [arrays[column].tolist() for column in 
+            ['sequence_number', 'amino_acid', 'protein_segment', 'bw']]
+    return [Residue.from_fields(sequence_number, letter, protein_segment or None, bw or None) 
+        for sequence_number, letter, protein_segment, bw in zip(*columns)]
+
+
+def _fetch_residues(uniprot_name, base_url, timeout):
+    response = _gpcrdb_session().get(f'{base_url}{uniprot_name}', timeout=timeout)
+    response.raise_for_status()
+    return [Residue(residueDict) for residueDict in response.json()]
+
+
+# residues of the receptors loaded by this process, by cache directory and 
+# uniprot name
+_receptor_residues = {}
+
+
+def load_receptor_residues(uniprot_names, concurrency=8, timeout=30, 
+    base_url=GPCRDB_RESIDUES_URL, cache_dir='~/GPCRDB'):
+
+    """Return the residues of the receptors uniprot_names as a dict of lists
+
+    Receptors are looked up in the process cache first, then in cache_dir, 
+    and the others are fetched from gpcrdb concurrently and added to both.
+
+    Arguments:
+
+    uniprot_names: uniprot names of the receptors ('adrb2_human')
+    concurrency: number of requests in flight at a time
+    timeout: seconds to wait for each request
+    base_url: url the uniprot name is appended to
+    cache_dir: directory of the cache; receptors are stored there as .npz 
+    files of their residue fields, and .json responses cached by earlier 
+    versions are converted
+
+    Raises requests.HTTPError for receptors gpcrdb does not serve.
+
+    """
+    assert(concurrency > 0)
+    cache_dir = os.path.expanduser(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    loaded = _receptor_residues.setdefault(cache_dir, {})
+    missing = []
+    for uniprot_name in dict.fromkeys(uniprot_names):
+        if uniprot_name in loaded:
+            continue
+        path = os.path.join(cache_dir, f'{uniprot_name}.npz')
+        try:
+            loaded[uniprot_name] = _load_residues(path)
+            continue
+        except (OSError, ValueError, KeyError):
+            pass
+        try:
+            with open(os.path.join(cache_dir, f'{uniprot_name}.json')) as fp:
+                residues = [Residue(residueDict) for residueDict in json.load(fp)]
+        except (OSError, ValueError):
+            missing.append(uniprot_name)
+            continue
+        _save_residues(path, residues)
+        loaded[uniprot_name] = residues
+
+    if missing:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            fetched = pool.map(lambda uniprot_name: _fetch_residues(uniprot_name, base_url, timeout), missing)
+            for uniprot_name, residues in zip(missing, fetched):
+                _save_residues(os.path.join(cache_dir, f'{uniprot_name}.npz'), residues)
+                loaded[uniprot_name] = residues
+    return { uniprot_name : loaded[uniprot_name] for uniprot_name in uniprot_names }
+
+
+def load_receptors(uniprot_names, **options):
+    """Return the Receptors uniprot_names as a dict, loading their residues 
+    together; options are those of load_receptor_residues"""
+    residues = load_receptor_residues(uniprot_names, **options)
+    return { uniprot_name : Receptor(uniprot_name, residues=residues[uniprot_name]) 
+        for uniprot_name in uniprot_names }
+
+
 class Receptor:
-    def __residues__(self, receptor):
+    def __residues__(self, receptor, cache_dir='~/GPCRDB'):
         assert isinstance(receptor, str)
-        directory = Path.home().joinpath(Path('GPCRDB/'))
-        Path.mkdir(directory, exist_ok=True)
-        file = directory.joinpath(f'{receptor}{".json"}')
-        try:
-            fp = file.open()
-            responseJSON = json.load(fp)
-        except:
-            response = requests.get(f'{"https://gpcrdb.org/services/residues/extended/"}{receptor}')
-            if response.ok:    
-                fp = file.open('w')
-                responseJSON = response.json()
-                json.dump(responseJSON, fp)
-        finally:
-            fp.close()
-            return { Residue(residueDict).abbr_seq_num : Residue(residueDict) for residueDict in responseJSON }
-
-    def __init__(self, uniprot_name):
+        return load_receptor_residues([receptor], cache_dir=cache_dir)[receptor]
+
+    def __init__(self, uniprot_name, gpcrdb_residues=None, residues=None, cache_dir='~/GPCRDB'):
+        """gpcrdb_residues are the residue dicts of the gpcrdb residues service 
+        for the receptor and residues its Residues; by default they are loaded 
+        by load_receptor_residues from cache_dir"""
         self._uniprot_name_ = uniprot_name
-        self._residues_ = self.__residues__(self._uniprot_name_)
-    
-    def residue_for_index(self, index):
-        assert isinstance(index, str)
-        a = self._residues_.get(index, None)
-        if a: 
-            return a
-        ai = None
+        if residues is None:
+            if gpcrdb_residues is None:
+                residues = self.__residues__(self._uniprot_name_, cache_dir)
+            else:
+                residues = [Residue(residueDict) for residueDict in gpcrdb_residues]
+        self._index_residues_(residues)
+
+    def _index_residues_(self, residues):
+        self._residues_ = { residue.abbr_seq_num : residue for residue in residues }
+        self._by_sequence_number_ = { residue.sequence_number : residue for residue in residues }
+        self._by_bw_ = { residue.bw : residue for residue in residues if residue.bw }
+        self._by_segment_ = {}
+        self._by_helix_ = {}
+        for residue in sorted(residues, key=lambda residue: residue.sequence_number):
+            self._by_segment_.setdefault(residue.protein_segment, []).append(residue)
+            if residue.helix:
+                self._by_helix_.setdefault(residue.helix, []).append(residue)
+        # sorted sequence numbers with their residues, for residues_for_indices
+        self._sequence_numbers_ = np.array(sorted(self._by_sequence_number_), dtype=np.int64)
+        self._sequence_residues_ = np.empty(len(self._sequence_numbers_) + 1, dtype=object)
+        self._sequence_residues_[:-1] = [self._by_sequence_number_[n] for n in self._sequence_numbers_]
+
+    @staticmethod
+    def _sequence_number_of_(index):
+        """Return the number ending index ('A123' -> 123) as it was written, 
+        None if there is none"""
         a = index
-        while not ai and a:
+        while a:
             try:
                 ai = int(a)
-            except:
+            except ValueError:
                 a = a[1:]
-        for key,value in self._residues_.items():
-            if key[3:] == a:
-                return value
+                continue
+            return ai if ai and str(ai) == a else None
         return None
+
+    def residue_for_index(self, index):
+        """Return the residue for index, either a key of residues ('ALA123') 
+        or a sequence number preceded by anything ('A123', '123'), None if 
+        there is none"""
+        assert isinstance(index, str)
+        a = self._residues_.get(index, None)
+        if a: 
+            return a
+        return self._by_sequence_number_.get(self._sequence_number_of_(index), None)
+
+    def residues_for_indices(self, indices):
+        """Return an object array of the residues for indices, None where there 
+        is none. indices are sequence numbers or strings as taken by 
+        residue_for_index; each distinct index is resolved once"""
+        indices = np.asarray(indices)
+        if indices.dtype.kind not in 'iu':
+            distinct, inverse = np.unique(indices, return_inverse=True)
+            resolved = np.empty(len(distinct), dtype=object)
+            resolved[:] = [self.residue_for_index(str(index)) for index in distinct]
+            return resolved[inverse.reshape(indices.shape)]
+        positions = np.searchsorted(self._sequence_numbers_, indices)
+        found = positions < len(self._sequence_numbers_)
+        found[found] = self._sequence_numbers_[positions[found]] == indices[found]
+        return self._sequence_residues_[np.where(found, positions, -1)]
+
+    def residue_for_sequence_number(self, sequence_number):
+        return self._by_sequence_number_.get(sequence_number, None)
+
+    def residue_for_bw(self, bw):
+        """Return the residue with the Ballesteros-Weinstein label bw ('3.50'), 
+        None if there is none"""
+        return self._by_bw_.get(bw, None)
+
+    def residues_in_segment(self, protein_segment):
+        """Return the residues of protein_segment ('TM3', 'ICL2'...) in sequence 
+        order"""
+        return tuple(self._by_segment_.get(protein_segment, ()))
+
+    def residues_in_helix(self, helix):
+        """Return the residues whose Ballesteros-Weinstein label is on helix 
+        ('3') in sequence order"""
+        return tuple(self._by_helix_.get(str(helix), ()))
     
     uniprot_name = property(lambda self: self._uniprot_name_)
     residues = property(lambda self: self._residues_)
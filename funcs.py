@@ -30,11 +30,14 @@ import sys
 import glob 
 import os
 import os.path
+import re
+import bisect
+import concurrent.futures
+import numpy as np
 from numpy import array, where, append, unique, zeros, ndarray, empty, abs, \
     ndarray, pi, e
-import formatter
 
-from .constants import AminoAcid
+from .constants import AminoAcid, amino_acid_codes, amino_acid_groups, UNKNOWN_AMINO_ACID
    
 
 
@@ -85,10 +88,220 @@ def parse_prot_cntct_line(prot_cntct_line):
 
 
 
+# Columns of a protein contact report, named like the keys of 
+# parse_prot_cntct_line; indices and networks are integers
+prot_cntct_columns = ('line_num', 'intrcn_typ', 'chain1', 'moe_dex1', 
+    'res_typ1', 'pdb_res_dex1', 'atom1', 'chain2', 'moe_dex2', 'res_typ2', 
+    'pdb_res_dex2', 'atom2', 'net')
+_prot_cntct_int_columns = ('line_num', 'moe_dex1', 'pdb_res_dex1', 'moe_dex2', 
+    'pdb_res_dex2', 'net')
+
+# used only to point at the line a report fails to parse at
+_prot_cntct_line_pattern = re.compile(
+    rb'[ \t]*(\d+)[ \t]+(\S+)[ \t]+(\S+)[ \t]+(-?\d+)[ \t]+(\S{3})(-?\d+)\.(\S+)'
+    rb'[ \t]+(\S+)[ \t]+(-?\d+)[ \t]+(\S{3})(-?\d+)\.(\S+)[ \t]+(-?\d+)[ \t]*\r?$')
+# contact lines are the lines of a report starting with their number
+_prot_cntct_line_start = re.compile(rb'[ \t]*\d+[ \t]')
+
+_is_whitespace = np.zeros(256, dtype=bool)
+_is_whitespace[list(b' \t\r\n\v\f')] = True
+
+
+def _field_chars(buffer, starts, stops):
+    # the bytes buffer[starts[i]:stops[i]] as rows of an (N, width) array 
+    # padded with zeros
+    width = int((stops - starts).max(initial=1))
+    index = starts[:, None] + np.arange(width)
+    chars = buffer[np.minimum(index, len(buffer) - 1)]
+    chars[index >= stops[:, None]] = 0
+    return chars
+
+
+def _byte_strings(buffer, starts, stops):
+    chars = _field_chars(buffer, starts, stops)
+    return chars.view(f'S{chars.shape[1]}').ravel()
+
+
+def _field_strings(buffer, starts, stops):
+    # decodes each distinct field once; fields of up to 8 bytes are told 
+    # apart as integers
+    chars = _field_chars(buffer, starts, stops)
+    if chars.shape[1] > 8:
+        return chars.view(f'S{chars.shape[1]}').ravel().astype(str)
+    padded = np.zeros((len(chars), 8), dtype=np.uint8)
+    padded[:, :chars.shape[1]] = chars
+    distinct, inverse = np.unique(padded.view(np.uint64).ravel(), return_inverse=True)
+    return distinct.view('S8').astype(str)[inverse]
+
+
+def _field_integers(buffer, starts, stops):
+    chars = _field_chars(buffer, starts, stops)
+    is_negative = chars[:, 0] == ord('-')
+    digits = chars.astype(np.int64) - ord('0')
+    is_digit = (digits >= 0) & (digits <= 9)
+    is_sign = np.zeros_like(is_digit)
+    is_sign[:, 0] = is_negative
+    if not (is_digit | is_sign | (chars == 0)).all() or not is_digit.any(axis=1).all():
+        raise ValueError('field is not an integer')
+    values = np.zeros(len(chars), dtype=np.int64)
+    for column, column_is_digit in zip(digits.T, is_digit.T):
+        values[column_is_digit] = values[column_is_digit] * 10 + column[column_is_digit]
+    return np.where(is_negative, -values, values)
+
+
+def _prot_cntct_fields(report):
+    # (start, stop) arrays of every field of the contact lines, found on 
+    # the bytes of the whole report at once
+    buffer = np.frombuffer(report, dtype=np.uint8)
+    is_space = np.append(_is_whitespace[buffer], True)
+    after_space = np.insert(is_space[:-1], 0, True)
+    starts = np.flatnonzero(~is_space & after_space)
+    stops = np.flatnonzero(is_space[1:] & ~is_space[:-1]) + 1
+    line_tokens = np.bincount(np.searchsorted(np.flatnonzero(buffer == ord('\n')), starts))
+    first_tokens = (np.cumsum(line_tokens) - line_tokens)[line_tokens > 1]
+    is_contact = np.char.isdigit(_byte_strings(buffer, starts[first_tokens], stops[first_tokens]))
+    if (line_tokens[line_tokens > 1][is_contact] != 9).any():
+        raise ValueError('contact line without 9 fields')
+    tokens = first_tokens[is_contact][:, None] + np.arange(9)
+    starts, stops = starts[tokens], stops[tokens]
+
+    fields = []
+    for i in range(9):
+        if i in (4, 7):
+            # residue, pdb index and atom, as in LEU13.O
+            dots = starts[:, i] + np.char.find(_byte_strings(buffer, starts[:, i], stops[:, i]), b'.')
+            if (dots < starts[:, i] + 4).any():
+                raise ValueError('contact point without residue, index and atom')
+            fields += [(starts[:, i], starts[:, i] + 3), (starts[:, i] + 3, dots), 
+                (dots + 1, stops[:, i])]
+        else:
+            fields.append((starts[:, i], stops[:, i]))
+    return buffer, fields
+
+
+def parse_prot_cntct_report(report):
+
+    """Return the contacts of the text of a MOE protein contact report as a 
+    dict of column arrays, keyed by prot_cntct_columns
+
+    Arguments:
+
+    report: text (str or bytes) of the report, or of any run of its lines
+
+    The fields of all contact lines are located in one vectorized pass over 
+    the bytes of the report; the header and other lines not starting with a 
+    number are skipped. Returns the same parts as parse_prot_cntct_line for 
+    every line, but as arrays, with the indices and networks as int64 and 
+    the rest as strings.
+
+    """
+    if isinstance(report, str):
+        report = report.encode()
+    assert isinstance(report, bytes)
+    try:
+        buffer, fields = _prot_cntct_fields(report)
+        return {column: (_field_integers if column in _prot_cntct_int_columns else 
+            _field_strings)(buffer, starts, stops) 
+            for column, (starts, stops) in zip(prot_cntct_columns, fields)}
+    except ValueError:
+        for line in report.splitlines():
+            if _prot_cntct_line_start.match(line) and not _prot_cntct_line_pattern.match(line):
+                raise ValueError(line.decode() + ' is not a protein contact line.')
+        raise
+
+
+def _report_lines(report):
+    if isinstance(report, (str, os.PathLike)):
+        with open(report, 'rb') as f:
+            yield from f
+    else:
+        for line in report:
+            yield line.encode() if isinstance(line, str) else line
+
+
+def read_prot_cntct_report(report):
+    """Return the contacts of a MOE protein contact report, a path or open 
+    file (text or binary), as a dict of column arrays. See 
+    parse_prot_cntct_report, and iter_prot_cntct_report for large reports"""
+    if isinstance(report, (str, os.PathLike)):
+        with open(report, 'rb') as f:
+            return parse_prot_cntct_report(f.read())
+    return parse_prot_cntct_report(report.read())
+
+
+def iter_prot_cntct_report(report, chunk_size=100000):
+    """Yield the contacts of a MOE protein contact report as dicts of column 
+    arrays of at most chunk_size contacts, holding only one chunk of lines in 
+    memory. See parse_prot_cntct_report"""
+    assert chunk_size > 0
+    lines = []
+    for line in _report_lines(report):
+        if _prot_cntct_line_start.match(line):
+            lines.append(line.rstrip(b'\r\n'))
+            if len(lines) == chunk_size:
+                yield parse_prot_cntct_report(b'\n'.join(lines))
+                lines = []
+    if lines:
+        yield parse_prot_cntct_report(b'\n'.join(lines))
+
+
+
+def _float_of(listFloats, i):
+    # the element by element conversion of float_list
+    try:
+        if isinstance(listFloats[i], complex):
+            listFloats[i] = abs(listFloats[i])
+        if isinstance(listFloats[i], str):
+            if listFloats[i].lower().strip() == 'pi':
+                listFloats[i] = pi
+            elif listFloats[i].lower().strip() == 'e':
+                listFloats[i] = e
+        return float(listFloats[i])
+    except ValueError:
+        raise ValueError(listFloats[i] + ' is not float-able.')
+
+
+_float_chunk_size = 4096
+
+
+def _float_array(listFloats):
+    # float_list of a list, tuple or 1-d array, converting chunks of it in
+    # bulk and by _float_of only the chunks holding complex values, strings
+    # naming pi or e or values that are not float-able (so that the first of
+    # those raises as it would element by element); None for other sequences
+    if isinstance(listFloats, ndarray):
+        if listFloats.ndim == 1 and listFloats.dtype.kind in 'biuf':
+            return listFloats.astype(float)
+        if listFloats.ndim == 1 and listFloats.dtype == np.complex128:
+            return abs(listFloats)
+        items = listFloats.tolist()
+    elif isinstance(listFloats, (list, tuple)):
+        items = listFloats
+    else:
+        return None
+    bulk = not any(issubclass(kind, complex) for kind in set(map(type, items)))
+    floats = empty(len(items), dtype=float)
+    for start in range(0, len(items), _float_chunk_size):
+        stop = min(start + _float_chunk_size, len(items))
+        if bulk:
+            try:
+                floats[start:stop] = np.fromiter(map(float, items[start:stop]), float, 
+                    stop - start)
+                continue
+            except (ValueError, TypeError):
+                pass
+        for i in range(start, stop):
+            floats[i] = _float_of(listFloats, i)
+    return floats
+
+
 def float_list(listFloats):
 
     """Return a numpy array of floats from a list of strings of floats
 
+    Lists, tuples and arrays are converted in bulk; 'pi', 'e' and complex 
+    values (as their abs) are accepted as well.
+
     """
     if isinstance(listFloats, (str)):
         templistFloats = [listFloats]
@@ -98,23 +311,15 @@ def float_list(listFloats):
     except TypeError:
         listFloats = [listFloats]
         list_len = len(listFloats)
+    list_blank = _float_array(listFloats)
+    if list_blank is not None:
+        return list_blank
     list_blank = empty(list_len, dtype=float)
     for i in range(list_len):
-        try:
-            if isinstance(listFloats[i], complex):
-                listFloats[i] = abs(listFloats[i])
-            if isinstance(listFloats[i], str):
-                if listFloats[i].lower().strip() == 'pi':
-                    listFloats[i] = pi
-                elif listFloats[i].lower().strip() == 'e':
-                    listFloats[i] = e
-            list_blank[i] = float(listFloats[i])
-        except ValueError:
-            raise ValueError(listFloats[i] + ' is not float-able.')
+        list_blank[i] = _float_of(listFloats, i)
     return list_blank
 
 
-
 def get_ranges(args, key='-range', flatten=True):
 
     """Return array of ints specified by form 'keyx1:y1[,x2:y2...]'.
@@ -140,10 +345,7 @@ def get_ranges(args, key='-range', flatten=True):
     assert isinstance(args, (list, tuple, ndarray))
     assert isinstance(flatten, bool) 
 
-    if flatten:
-        vld_dex = array([], dtype=int) 
-    else:
-        vld_dex = []
+    vld_dex = []
     for i, arg in enumerate(args):
         if arg.startswith(key):
             assert isinstance(arg, str)
@@ -157,17 +359,144 @@ def get_ranges(args, key='-range', flatten=True):
                     ibeg, iend = a
                 except ValueError:
                     sys.exit('Part of ' + cur_rng + ' != int')
-                if flatten:
-                    vld_dex = append(vld_dex, range(ibeg, iend + 1))
-                else:
-                    vld_dex.append(range(ibeg, iend + 1))
+                vld_dex.append(range(ibeg, iend + 1))
     if flatten:
-        return vld_dex.flatten()
+        # one concatenation instead of growing the array range by range
+        return np.concatenate([array([], dtype=int)] + 
+            [np.arange(rng.start, rng.stop) for rng in vld_dex])
     else:
         return vld_dex
 
 
 
+class IntervalSet(object):
+
+    """Set of integers stored as sorted, merged ranges
+
+    Built from (first, last) pairs, inclusive as in the ranges of 
+    get_ranges, and kept as arrays of the first member of every range and 
+    of the integer after its last, so that membership is a binary search 
+    and membership of a whole array (e.g. of resSeqs) one searchsorted.
+
+    """
+
+    def __init__(self, ranges=()):
+        ranges = [sorted((int(first), int(last))) for first, last in ranges]
+        starts = np.array([first for first, _ in ranges], dtype=np.int64)
+        stops = np.array([last + 1 for _, last in ranges], dtype=np.int64)
+        self._starts, self._stops = self._merged(starts, stops)
+
+    @staticmethod
+    def _merged(starts, stops):
+        # sort the ranges and merge those that overlap or touch
+        order = np.argsort(starts, kind='stable')
+        starts, stops = starts[order], stops[order]
+        reach = np.maximum.accumulate(stops) if len(stops) else stops
+        begins = np.ones(len(starts), dtype=bool)
+        begins[1:] = starts[1:] > reach[:-1]
+        ends = np.append(np.flatnonzero(begins)[1:], len(starts)) - 1
+        return starts[begins], reach[ends] if len(starts) else reach
+
+    @classmethod
+    def _from_bounds(cls, starts, stops):
+        interval_set = cls()
+        interval_set._starts, interval_set._stops = cls._merged(starts, stops)
+        return interval_set
+
+    @classmethod
+    def parse(cls, string):
+        """Return the set of a string of ranges 'x1:y1[,x2:y2...]', the form 
+        taken by get_ranges after its key"""
+        ranges = []
+        for cur_rng in string.split(','):
+            beg, end = cur_rng.split(':')
+            try:
+                ranges.append((int(beg), int(end)))
+            except ValueError:
+                raise ValueError('Part of ' + cur_rng + ' != int')
+        return cls(ranges)
+
+    starts = property(lambda self: self._starts)
+    stops = property(lambda self: self._stops)
+    ranges = property(lambda self: list(zip(self._starts.tolist(), (self._stops - 1).tolist())))
+
+    def __contains__(self, value):
+        i = bisect.bisect_right(self._starts, value) - 1
+        return i >= 0 and value < self._stops[i]
+
+    def contains(self, values):
+        """Return a boolean array of the membership of every value"""
+        values = np.asarray(values)
+        i = np.searchsorted(self._starts, values, 'right') - 1
+        return (i >= 0) & (values < self._stops[np.maximum(i, 0)] if len(self._stops) else False)
+
+    def __len__(self):
+        return int((self._stops - self._starts).sum())
+
+    def __bool__(self):
+        return bool(len(self._starts))
+
+    def __iter__(self):
+        return iter(self.values().tolist())
+
+    def values(self):
+        """Return the members as a sorted integer array"""
+        return np.concatenate([np.array([], dtype=np.int64)] + 
+            [np.arange(start, stop) for start, stop in zip(self._starts, self._stops)])
+
+    def _combine(self, other, keep):
+        # the bounds of both sets cut the integers into segments, each in or 
+        # out of either set as a whole; keep tells which to keep
+        assert isinstance(other, IntervalSet)
+        bounds = np.unique(np.concatenate([self._starts, self._stops, other._starts, other._stops]))
+        if not len(bounds):
+            return IntervalSet()
+        kept = keep(self.contains(bounds[:-1]), other.contains(bounds[:-1]))
+        return self._from_bounds(bounds[:-1][kept], bounds[1:][kept])
+
+    def union(self, other):
+        return self._combine(other, lambda a, b: a | b)
+
+    def intersection(self, other):
+        return self._combine(other, lambda a, b: a & b)
+
+    def difference(self, other):
+        return self._combine(other, lambda a, b: a & ~b)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and \
+            np.array_equal(self._starts, other._starts) and np.array_equal(self._stops, other._stops)
+
+    def __repr__(self):
+        return 'IntervalSet(%s)' % self.ranges
+
+
+
+def get_interval_set(args, key='-range'):
+
+    """Return the IntervalSet of the ranges of args of the form 
+    'keyx1:y1[,x2:y2...]', like get_ranges, removing those args
+
+    Every arg starting with key is parsed and the ranges of all of them are 
+    united; exits as get_ranges does if a bound is not an int.
+
+    """
+    assert isinstance(args, list)
+    interval_set = IntervalSet()
+    for arg in [arg for arg in args if arg.startswith(key)]:
+        args.remove(arg)
+        try:
+            interval_set |= IntervalSet.parse(arg[len(key):])
+        except ValueError as error:
+            sys.exit(str(error))
+    return interval_set
+
+
+
 class ContactEnd(object):
     
     @classmethod
@@ -187,7 +516,7 @@ class ContactEnd(object):
         parts[:1] = [parts[0][:3], parts[0][3:]]
         return ContactEnd(parts[0], int(parts[1]), parts[2], )
 
-    def __init__(self, residue1_name, UID1, atom1_name):
+    def __init__(self, residue_name, UID, atom_name):
         assert isinstance(residue_name, str)
         assert isinstance(UID, int)
         assert isinstance(atom_name, str)
@@ -201,14 +530,15 @@ class ContactEnd(object):
     residue_name = property(lambda self: self._residue_name)
         
     def find_name_in_amino_acids(self, aminoacids):
+        # one name is found fastest by a pass over the abbreviations; whole 
+        # arrays of names are translated by amino_acid_codes
         aadex = where(aminoacids[:, 1] == self.residue_name)
         if len(aadex[0]) == 0:
-            raise LookupError('%s %s of %s is not in list' % (
+            raise LookupError('%s %s is not in list' % (
                 self.residue_name, 
-                residue1UID, 
-                report
+                self.UID
             ))
-        return aminoacids[aadex, 3][0, 0]
+        return aminoacids[aadex[0][0], 3]
 
 
 
@@ -254,6 +584,143 @@ class InterresidueContact(object):
 
 
 
+class InteractionPairHistogram(object):
+
+    """Counts of the interaction pairs of contacts, the pair of groups of 
+    their residues and their type as in 
+    InterresidueContact.interaction_pair_string, over any number of reports
+
+    Counts are an int64 array indexed by contact type code, lower group and 
+    higher group; contact types are coded in the order they are first met. 
+    The paths of the reports counted are kept, so a histogram can be 
+    updated with new reports alone (see count_interaction_pairs), and 
+    histograms of different reports are merged by adding their counts.
+
+    """
+
+    group_count = int(amino_acid_groups.max()) + 1
+
+    def __init__(self, contact_types=(), counts=None, reports=()):
+        self._contact_types = list(contact_types)
+        shape = (len(self._contact_types), self.group_count, self.group_count)
+        self._counts = np.zeros(shape, dtype=np.int64) if counts is None else \
+            np.array(counts, dtype=np.int64).reshape(shape)
+        self._reports = set(reports)
+
+    contact_types = property(lambda self: tuple(self._contact_types))
+    counts = property(lambda self: self._counts)
+    reports = property(lambda self: frozenset(self._reports))
+    total = property(lambda self: int(self._counts.sum()))
+
+    def _type_codes(self, contact_types):
+        # codes of contact_types, adding the new ones
+        distinct, inverse = np.unique(np.asarray(contact_types, dtype=str), return_inverse=True)
+        known = {contact_type: i for i, contact_type in enumerate(self._contact_types)}
+        new = [contact_type for contact_type in distinct.tolist() if contact_type not in known]
+        if new:
+            known.update((contact_type, len(self._contact_types) + i) 
+                for i, contact_type in enumerate(new))
+            self._contact_types += new
+            self._counts = np.concatenate([self._counts, 
+                np.zeros((len(new),) + self._counts.shape[1:], dtype=np.int64)])
+        return np.array([known[contact_type] for contact_type in distinct.tolist()], 
+            dtype=np.int64)[inverse.ravel()]
+
+    def add_contacts(self, contacts):
+        """Count contacts, a dict of column arrays of parse_prot_cntct_report"""
+        codes1 = amino_acid_codes(contacts['res_typ1'])
+        codes2 = amino_acid_codes(contacts['res_typ2'])
+        for codes, column in ((codes1, 'res_typ1'), (codes2, 'res_typ2')):
+            if (codes == UNKNOWN_AMINO_ACID).any():
+                raise KeyError(contacts[column][codes == UNKNOWN_AMINO_ACID][0])
+        groups1, groups2 = amino_acid_groups[codes1], amino_acid_groups[codes2]
+        types = self._type_codes(contacts['intrcn_typ'])
+        bins = np.ravel_multi_index((types, np.minimum(groups1, groups2), 
+            np.maximum(groups1, groups2)), self._counts.shape)
+        self._counts += np.bincount(bins, minlength=self._counts.size).reshape(self._counts.shape)
+
+    def add_report(self, report, chunk_size=100000):
+        """Count the contacts of the report at path report, in chunks"""
+        for contacts in iter_prot_cntct_report(report, chunk_size):
+            self.add_contacts(contacts)
+        self._reports.add(os.path.abspath(report))
+
+    def merge(self, other):
+        """Add the counts and reports of other to this histogram"""
+        assert isinstance(other, InteractionPairHistogram)
+        types = self._type_codes(other._contact_types) if other._contact_types else \
+            np.array([], dtype=np.int64)
+        np.add.at(self._counts, types, other._counts)
+        self._reports |= other._reports
+        return self
+
+    def table(self):
+        """Return the interaction pair strings with counts, sorted, and their 
+        counts: the x and y of a distribution for unionize_2_distros"""
+        types, groups1, groups2 = np.nonzero(self._counts)
+        pairs = np.array([f'{group1} {group2} {self._contact_types[contact_type]}' 
+            for contact_type, group1, group2 in zip(types.tolist(), groups1.tolist(), 
+            groups2.tolist())], dtype=str)
+        order = np.argsort(pairs, kind='stable')
+        return pairs[order], self._counts[types, groups1, groups2][order]
+
+    def save(self, f):
+        """Save the histogram to a path or binary file in numpy .npz format"""
+        np.savez(f, contact_types=np.array(self._contact_types, dtype=str), 
+            counts=self._counts, reports=np.array(sorted(self._reports), dtype=str))
+
+    @classmethod
+    def load(cls, f):
+        with np.load(f, allow_pickle=False) as arrays:
+            return cls(arrays['contact_types'].tolist(), arrays['counts'], 
+                arrays['reports'].tolist())
+
+
+
+def _report_histogram(report):
+    histogram = InteractionPairHistogram()
+    histogram.add_report(report)
+    return histogram
+
+
+def count_interaction_pairs(reports, histogram=None, processes=None):
+
+    """Return the InteractionPairHistogram of the contacts of the MOE 
+    reports at paths reports
+
+    Arguments:
+
+    reports: paths of the reports
+    histogram: histogram to update, in place; reports it has already 
+    counted are skipped, so only new reports are read
+    processes: number of worker processes (default: os.cpu_count()); 1 
+    counts in this process
+
+    Every report is counted into its own histogram by a worker, and the 
+    histograms, a few hundred integers each, are merged here.
+
+    """
+    histogram = InteractionPairHistogram() if histogram is None else histogram
+    counted = histogram.reports
+    new = [report for report in dict.fromkeys(os.path.abspath(report) for report in reports) 
+        if report not in counted]
+    if processes == 1:
+        for report in new:
+            histogram.merge(_report_histogram(report))
+        return histogram
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        for partial in pool.map(_report_histogram, new):
+            histogram.merge(partial)
+    return histogram
+
+
+
+def _last_of_each(keys):
+    # indices of the last occurrence of every distinct key, in no order
+    _, last = np.unique(keys[::-1], return_index=True)
+    return len(keys) - 1 - last
+
+
 def unionize_distro_given_x(cmbn_x, x, y):
 
     """Return union of y's given union of x's
@@ -263,27 +730,72 @@ def unionize_distro_given_x(cmbn_x, x, y):
     x: array/list of x values of first set
     y: array/list of y values of first set
 
+    Every y is copied to the positions where cmbn_x equals its x, the 
+    later of repeated x's winning; positions are found by searchsorted on 
+    the sorted cmbn_x.
+
     """
 
     assert(type(cmbn_x) == ndarray)
     assert(len(x) == len(y))
 
     # make a new y lists as long as the combination 
-    lngth = len(cmbn_x)
-    cmbn_y = zeros(lngth)
-
-    # copy the y's to combination  array 
-    # at the loctions at which the array of x corresponds to the 
-    # array of the combination of x.
-    # In other words copy the y's from the original set to y's of the 
-    # combination set at the proper position as determined by comparing the 
-    # original x positions to the combined x positions
-    for i, j in enumerate(x):
-        bool_ar = (j == cmbn_x)
-        cmbn_y[bool_ar] = y[i]
+    cmbn_y = zeros(len(cmbn_x))
+    x = np.asarray(x)
+    y = np.asarray(y)
+    keep = _last_of_each(x) if len(x) else np.array([], dtype=np.int64)
+    if x.dtype.kind in 'fc':
+        # nan equals nothing
+        keep = keep[x[keep] == x[keep]]
+    x, y = x[keep], y[keep]
+
+    # cmbn_x may be unsorted and hold repeats; every x fills the run of its 
+    # equals in the sorted cmbn_x
+    order = np.argsort(cmbn_x, kind='stable')
+    sorted_x = cmbn_x[order]
+    left = np.searchsorted(sorted_x, x, 'left')
+    counts = np.searchsorted(sorted_x, x, 'right') - left
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cmbn_y[order[np.repeat(left, counts) + offsets]] = np.repeat(y, counts)
 
     return cmbn_y
- 
+
+
+def unionize_distros(xs, ys):
+
+    """Return the union of the abscissae of N sets and the (N, len(union)) 
+    array of their ordinates on it, zero where a set has no value
+
+    Arguments:
+
+    xs: sequence of the abscissae of the N sets
+    ys: sequence of the ordinates of the N sets
+
+    Equivalent to unionize_distro_given_x of every set on the union, done 
+    with one sort and one searchsorted over all the sets together.
+
+    """
+
+    assert(len(xs) == len(ys))
+    assert all(len(x) == len(y) for x, y in zip(xs, ys))
+
+    lengths = [len(x) for x in xs]
+    all_x = np.concatenate([np.asarray(x) for x in xs]) if xs else np.array([])
+    all_y = np.concatenate([np.asarray(y, dtype=float) for y in ys]) if ys else np.array([])
+    cmbn_x = unique(all_x)
+    cmbn_ys = zeros((len(xs), len(cmbn_x)))
+    if not len(all_x):
+        return cmbn_x, cmbn_ys
+
+    rows = np.repeat(np.arange(len(xs)), lengths)
+    columns = np.searchsorted(cmbn_x, all_x)
+    keep = _last_of_each(rows * len(cmbn_x) + columns)
+    if all_x.dtype.kind in 'fc':
+        # nan equals nothing
+        keep = keep[all_x[keep] == all_x[keep]]
+    cmbn_ys[rows[keep], columns[keep]] = all_y[keep]
+    return cmbn_x, cmbn_ys
+
 # Unionize the x axis of two distros. Inputs are 4 arrays. Output is three 
 # arrays the new x, y1, and y2
 
@@ -303,12 +815,6 @@ def unionize_2_distros(x1, y1, x2, y2):
     assert(len(x1) == len(y1))
     assert(len(x2) == len(y2))
 
-    # Make a union of unique elements between the x1 and x2 sets
-    cmbn_x = unique(append(x1, x2))
-
-    cmbn_y1 = unionize_distro_given_x(cmbn_x, x1, y1)
-    cmbn_y2 = unionize_distro_given_x(cmbn_x, x2, y2)
+    cmbn_x, (cmbn_y1, cmbn_y2) = unionize_distros([x1, x2], [y1, y2])
     
     return cmbn_x, cmbn_y1, cmbn_y2
-
-
@@ -2,13 +2,30 @@ import urllib.request as urlrequest
 from urllib.error import URLError as urlerror
 import os
 import os.path
+import sys
 import re
-from numpy import array, append # TODO: use np
 import numpy as np
-from bs4 import BeautifulSoup
 import functools
+import threading
+import time
+import requests
+import hashlib
+import tempfile
+import concurrent.futures
+import mmap
+import gc
+import contextlib
+import datetime
+import email.utils
+
+from .constants import amino_acid_codes, amino_acid_letters, UNKNOWN_AMINO_ACID
+from .funcs import IntervalSet
 
 class PDBHelixLine(object):
+    __slots__ = ('_serNum', '_helixID', '_intResName', '_initChainID', '_initSeqNum', 
+        '_initICode', '_endResName', '_endChainID', '_endSeqNum', '_endICode', 
+        '_helixClass', '_comment', '_length')
+
     @classmethod
     def parse_string(cls, string):
         assert type(string) == str 
@@ -148,6 +165,10 @@ def parse_pdb_HELIX_line(hlx_line):
 
 
 class PDBAtomLine(object):
+    __slots__ = ('_serial', '_name', '_altLoc', '_resName', '_chainID', '_resSeq', 
+        '_iCode', '_x', '_y', '_z', '_occupancy', '_tempFactor', '_element', 
+        '_charge', '_kind')
+
     @classmethod
     def parse_string(cls, string):
         assert type(string) == str 
@@ -179,21 +200,22 @@ class PDBAtomLine(object):
     
     def __init__(self, serial, name, altLoc, resName, chainID, resSeq, 
         iCode, x, y, z, occupancy, tempFactor, element, charge, kind='ATOM'):
+        # fields with few distinct values are interned so atoms share them
         self._serial = serial.strip()
-        self._name = name.strip()
-        self._altLoc = altLoc.strip()
-        self._resName = resName.strip()
-        self._chainID = chainID.strip()
-        self._resSeq = resSeq.strip()
-        self._iCode = iCode.strip()
+        self._name = sys.intern(name.strip())
+        self._altLoc = sys.intern(altLoc.strip())
+        self._resName = sys.intern(resName.strip())
+        self._chainID = sys.intern(chainID.strip())
+        self._resSeq = sys.intern(resSeq.strip())
+        self._iCode = sys.intern(iCode.strip())
         self._x = x.strip()
         self._y = y.strip()
         self._z = z.strip()
-        self._occupancy = occupancy.strip()
+        self._occupancy = sys.intern(occupancy.strip())
         self._tempFactor = tempFactor.strip()
-        self._element = element.strip()
-        self._charge = charge.strip()
-        self._kind = kind
+        self._element = sys.intern(element.strip())
+        self._charge = sys.intern(charge.strip())
+        self._kind = sys.intern(kind)
 
     @classmethod
     def for_dict(cls, dict):
@@ -259,6 +281,12 @@ class PDBAtomLine(object):
             self._kind if kind == "<replace>" else kind
         )
 
+    def fields(self):
+        """Return the fields of the line in the order of print_pdb_ATOM_line"""
+        return (self._kind, self._serial, self._name, self._altLoc, self._resName, 
+            self._chainID, self._resSeq, self._iCode, self._x, self._y, self._z, 
+            self._occupancy, self._tempFactor, self._element, self._charge)
+
     def as_dict(self, atom='ATOM'):
         parts = {}
         parts['ATOM'] = self._kind
@@ -289,93 +317,1505 @@ class PDBAtomLine(object):
         return print_pdb_ATOM_line(self.as_dict())
 
 
+_atom_record_pattern = re.compile(rb'^(?:ATOM  |HETATM)[^\r\n]*', re.MULTILINE)
+
+
+def _fixed_width_block(records, width=80):
+    """Return an (N, width) uint8 array of ATOM/HETATM records padded to 
+    width columns, so every field is a fixed column slice of the block"""
+    padded = b''.join(record.ljust(width)[:width] for record in records)
+    return np.frombuffer(padded, dtype=np.uint8).reshape(len(records), width)
+
+
+def _block_column(block, start, stop):
+    return np.ascontiguousarray(block[:, start:stop]).view(f'S{stop - start}').ravel()
+
+
+def _code_dtype(category_count):
+    return np.uint8 if category_count <= 1 << 8 else \
+        np.uint16 if category_count <= 1 << 16 else np.int64
+
+
+def _categorical(values):
+    """Return codes into the sorted distinct values and the distinct values"""
+    categories, codes = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return codes.astype(_code_dtype(len(categories))), categories
+
+
+def _block_categorical(block, start, stop):
+    """Return the stripped strings of a column of the block as categorical 
+    codes and categories"""
+    # distinct raw fields are found by comparing the bytes as integers
+    width = 1 << int(np.ceil(np.log2(stop - start)))
+    raw = np.full((len(block), width), ord(' '), dtype=np.uint8)
+    raw[:, :stop - start] = block[:, start:stop]
+    raw_values, raw_codes = np.unique(raw.view(f'u{width}').ravel(), return_inverse=True)
+    # fields differing only in padding strip to the same category
+    stripped = np.char.strip(raw_values.view(f'S{width}')).astype(f'U{width}')
+    codes, categories = _categorical(stripped)
+    return codes[raw_codes].astype(_code_dtype(len(categories))), categories
+
+
+def _block_numbers(block, start, stop, dtype, blank):
+    column = np.char.strip(_block_column(block, start, stop))
+    is_blank = column == b''
+    if is_blank.any():
+        column[is_blank] = blank
+    return column.astype(dtype)
+
+
+def _int_or_zero(field):
+    try:
+        return int(field)
+    except ValueError:
+        return 0
+
+
+def _base36_digits(letters):
+    digits = np.full(256, -1, dtype=np.int64)
+    digits[np.frombuffer(b'0123456789', dtype=np.uint8)] = np.arange(10)
+    digits[np.frombuffer(letters, dtype=np.uint8)] = np.arange(10, 36)
+    return digits
+
+
+_upper_base36_digits = _base36_digits(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+_lower_base36_digits = _base36_digits(b'abcdefghijklmnopqrstuvwxyz')
+
+
+def _hybrid36_decode(fields):
+
+    """Return the integers of an (N, width) uint8 array of right-justified 
+    decimal or hybrid-36 fields
+
+    Hybrid-36 numbers count on past the largest decimal of the width in 
+    base 36, first with upper case letters (A0000 is 100000 for a serial) 
+    then with lower case ones, as written for structures of more than 
+    99999 atoms or 9999 residues. Fields that are neither, as the ***** of 
+    numbers too wide for their columns, are 0 like blank ones.
+
+    """
+    count, width = fields.shape
+    values = np.zeros(count, dtype=np.int64)
+    first = fields[:, 0]
+    is_upper = (first >= ord('A')) & (first <= ord('Z'))
+    is_lower = (first >= ord('a')) & (first <= ord('z'))
+    is_decimal = ~(is_upper | is_lower)
+    if is_decimal.any():
+        column = np.char.strip(np.ascontiguousarray(fields[is_decimal]).view(f'S{width}').ravel())
+        column[column == b''] = b'0'
+        try:
+            values[is_decimal] = column.astype(np.int64)
+        except ValueError:
+            distinct, inverse = np.unique(column, return_inverse=True)
+            values[is_decimal] = np.array([_int_or_zero(field) for field in distinct.tolist()], 
+                dtype=np.int64)[inverse.reshape(-1)]
+    for is_hybrid, digits, offset in (
+        (is_upper, _upper_base36_digits, 10 ** width - 10 * 36 ** (width - 1)), 
+        (is_lower, _lower_base36_digits, 10 ** width + 16 * 36 ** (width - 1))):
+        if is_hybrid.any():
+            field_digits = digits[fields[is_hybrid]]
+            numbers = field_digits @ 36 ** np.arange(width - 1, -1, -1, dtype=np.int64) + offset
+            values[is_hybrid] = np.where((field_digits >= 0).all(axis=1), numbers, 0)
+    return values
+
+
+def _hybrid36_integers(strings, width):
+    """Return the integers of stripped decimal or hybrid-36 strings, see 
+    _hybrid36_decode"""
+    try:
+        return np.asarray(strings, dtype=str).astype(np.int64)
+    except ValueError:
+        pass
+    fields = np.char.rjust(np.asarray(strings, dtype=f'S{width}'), width)
+    return _hybrid36_decode(fields.view(np.uint8).reshape(len(fields), width))
+
+
+def _hybrid36(value, width):
+    """Return the decimal or, past the largest decimal of width characters, 
+    hybrid-36 string of an integer; '*' * width when it has none"""
+    if value < 10 ** width:
+        return str(value)
+    value -= 10 ** width
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    if value >= 26 * 36 ** (width - 1):
+        value -= 26 * 36 ** (width - 1)
+        letters = letters.lower()
+    value += 10 * 36 ** (width - 1)
+    if value >= 36 ** width:
+        return '*' * width
+    digits = '0123456789' + letters
+    string = ''
+    for _ in range(width):
+        value, digit = divmod(value, 36)
+        string = digits[digit] + string
+    return string
+
+
+def _hybrid36_strings(values, width):
+    return _formatted(values, functools.partial(_hybrid36, width=width))
+
+
+class PDBAtomTable(object):
+
+    """Struct-of-arrays table of the ATOM/HETATM records of a pdb file
+
+    Every column is a numpy array with one entry per atom, in file order.
+    serial and resSeq are integers (decoded from hybrid-36 past 99999 atoms 
+    or 9999 residues, see _hybrid36_decode), r is an (N, 3) float64 array of 
+    coordinates, occupancy and tempFactor are floats (nan when blank) and 
+    the remaining columns are arrays of stripped strings.
+
+    String columns are stored categorically, as small integer codes into 
+    an array of their distinct values (see codes and categories), so a 
+    column of a million atom names takes a million bytes.
+
+    """
+
+    columns = ('kind', 'serial', 'name', 'altLoc', 'resName', 'chainID', 
+        'resSeq', 'iCode', 'r', 'occupancy', 'tempFactor', 'element', 'charge')
+    categorical_columns = ('kind', 'name', 'altLoc', 'resName', 'chainID', 
+        'iCode', 'element', 'charge')
+
+    @classmethod
+    def parse_string(cls, string):
+        if type(string) == str:
+            string = string.encode()
+        assert type(string) == bytes
+        return cls.for_records(_atom_record_pattern.findall(string))
+
+    @classmethod
+    def parse_file(cls, pdb_file):
+        if isinstance(pdb_file, (str, os.PathLike)):
+            with open(pdb_file, 'rb') as f:
+                return cls.parse_string(f.read())
+        return cls.parse_string(pdb_file.read())
+
+    @classmethod
+    def for_records(cls, records):
+        """Return a table for a list of stripped ATOM/HETATM records as bytes"""
+        if not len(records):
+            return cls.empty()
+        block = _fixed_width_block(records)
+        r = np.empty((len(records), 3))
+        for i, start in enumerate((30, 38, 46)):
+            r[:, i] = _block_numbers(block, start, start + 8, np.float64, b'nan')
+        return PDBAtomTable(
+            _block_categorical(block, 0, 6),
+            _hybrid36_decode(block[:, 6:11]),
+            _block_categorical(block, 12, 16),
+            _block_categorical(block, 16, 17),
+            _block_categorical(block, 17, 21),
+            _block_categorical(block, 21, 22),
+            _hybrid36_decode(block[:, 22:26]),
+            _block_categorical(block, 26, 27),
+            r,
+            _block_numbers(block, 54, 60, np.float64, b'nan'),
+            _block_numbers(block, 60, 66, np.float64, b'nan'),
+            _block_categorical(block, 76, 78),
+            _block_categorical(block, 78, 80)
+        )
+
+    @classmethod
+    def for_atom_lines(cls, atom_lines):
+        return cls.for_records([str(atom_line).encode() for atom_line in atom_lines])
+
+    @classmethod
+    def for_atoms(cls, atoms):
+        table = cls.for_records([str(atom).encode() for atom in atoms])
+        if len(atoms):
+            table.r[:] = [atom.r for atom in atoms]
+        return table
+
+    @classmethod
+    def empty(cls):
+        return PDBAtomTable(*[np.empty((0, 3)) if column == 'r' else 
+            np.array([], dtype=np.int64 if column in ('serial', 'resSeq') else 
+            np.float64 if column in ('occupancy', 'tempFactor') else str) 
+            for column in cls.columns])
+
+    def __init__(self, kind, serial, name, altLoc, resName, chainID, resSeq, 
+        iCode, r, occupancy, tempFactor, element, charge):
+        """String columns are arrays of strings or (codes, categories) pairs"""
+        assert(r.shape == (len(serial), 3))
+        self._serial = serial
+        self._resSeq = resSeq
+        self._r = r
+        self._occupancy = occupancy
+        self._tempFactor = tempFactor
+        self._codes = {}
+        self._categories = {}
+        for column, values in zip(self.categorical_columns, 
+            (kind, name, altLoc, resName, chainID, iCode, element, charge)):
+            self._codes[column], self._categories[column] = \
+                values if type(values) == tuple else _categorical(values)
+        self._selections = {}
+        self._coordinate_selections = {}
+
+    def codes(self, column):
+        """Return the integer codes of a string column into its categories"""
+        return self._codes[column]
+
+    def categories(self, column):
+        """Return the sorted distinct values of a string column"""
+        return self._categories[column]
+
+    def _column(self, column):
+        return self._categories[column][self._codes[column]]
+
+    kind = property(lambda self: self._column('kind'))
+    serial = property(lambda self: self._serial)
+    name = property(lambda self: self._column('name'))
+    altLoc = property(lambda self: self._column('altLoc'))
+    resName = property(lambda self: self._column('resName'))
+    chainID = property(lambda self: self._column('chainID'))
+    resSeq = property(lambda self: self._resSeq)
+    iCode = property(lambda self: self._column('iCode'))
+    r = property(lambda self: self._r)
+    occupancy = property(lambda self: self._occupancy)
+    tempFactor = property(lambda self: self._tempFactor)
+    element = property(lambda self: self._column('element'))
+    charge = property(lambda self: self._column('charge'))
+
+    def __len__(self):
+        return len(self._serial)
+
+    def _encoded(self, column):
+        if column in self.categorical_columns:
+            return self._codes[column], self._categories[column]
+        return getattr(self, column)
+
+    def __getitem__(self, index):
+        """Return a table of the rows selected by a slice, index array or mask"""
+        return PDBAtomTable(*[(self._codes[column][index], self._categories[column]) 
+            if column in self.categorical_columns else getattr(self, column)[index] 
+            for column in self.columns])
+
+    def with_coordinates(self, r):
+        """Return a table sharing every column but the coordinates, and the 
+        masks of the selections evaluated on them that do not use the 
+        coordinates"""
+        table = PDBAtomTable(*[r if column == 'r' else self._encoded(column) 
+            for column in self.columns])
+        table._selections = self._selections
+        return table
+
+    def mask(self, selection):
+        """Return the boolean mask of the atoms in a Selection, computed once 
+        and kept until the columns are edited or it is one of more than 
+        _KEPT_SELECTIONS masks and the least recently used
+
+        Masks of selections that use the coordinates are kept by this table 
+        alone, the others are shared with the tables of with_coordinates.
+
+        """
+        selections = self._coordinate_selections if selection.uses_coordinates \
+            else self._selections
+        # the dict is in order of use, least recent first
+        mask = selections.pop(selection, None)
+        if mask is None:
+            mask = np.asarray(selection.evaluate(self), dtype=bool)
+            assert mask.shape == (len(self),)
+            while len(selections) >= _KEPT_SELECTIONS:
+                del selections[next(iter(selections))]
+        selections[selection] = mask
+        return mask
+
+    def indices(self, selection):
+        """Return the indices of the atoms in a Selection, a slice when they 
+        are consecutive so that indexing with them gives views"""
+        return _as_slice(np.flatnonzero(self.mask(selection)))
+
+    def select(self, selection):
+        """Return the table of the atoms in a Selection"""
+        return self[self.indices(selection)]
+
+    def _atom_fields(self):
+        # the fields of the atom lines but the coordinates, every column 
+        # converted to a list of strings at once
+        fields = {column: np.array(self._categories[column].tolist(), dtype=object)[
+            self._codes[column]].tolist() for column in self.categorical_columns}
+        return [_hybrid36_strings(self._serial, 5), fields['name'], fields['altLoc'], 
+            fields['resName'], fields['chainID'], _hybrid36_strings(self._resSeq, 4), 
+            fields['iCode'], _formatted(self._occupancy, _format_or_blank), 
+            _formatted(self._tempFactor, _format_or_blank), fields['element'], 
+            fields['charge'], fields['kind']]
+
+    def atom_line(self, i):
+        return self[[i]].atom_lines()[0]
+
+    def atom_lines(self):
+        """Return a PDBAtomLine per atom, converting each column at once"""
+        return _table_row_atom_lines(self._atom_fields(), list(self._r))
+
+    def save(self, f, **metadata):
+        """Save the columns to a path or binary file in numpy .npz format, 
+        with optional metadata arrays"""
+        arrays = {f'metadata_{key}': value for key, value in metadata.items()}
+        for column in self.columns:
+            if column in self.categorical_columns:
+                arrays[f'{column}_codes'] = self._codes[column]
+                arrays[f'{column}_categories'] = self._categories[column]
+            else:
+                arrays[column] = getattr(self, column)
+        np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, f):
+        """Return the table saved in a path or binary file, and its metadata"""
+        with np.load(f, allow_pickle=False) as arrays:
+            table = PDBAtomTable(*[(arrays[f'{column}_codes'], arrays[f'{column}_categories']) 
+                if column in cls.categorical_columns else arrays[column] 
+                for column in cls.columns])
+            metadata = {key[len('metadata_'):]: arrays[key] for key in arrays.files 
+                if key.startswith('metadata_')}
+        return table, metadata
+
+    def residue_indices(self):
+        """Return the residue index of every atom and the index of the first 
+        atom of every residue; atoms belong to the same residue while 
+        chainID, resSeq and iCode repeat"""
+        starts_residue = np.ones(len(self), dtype=bool)
+        starts_residue[1:] = (self._resSeq[1:] != self._resSeq[:-1])
+        for column in ('chainID', 'iCode'):
+            codes = self._codes[column]
+            starts_residue[1:] |= codes[1:] != codes[:-1]
+        return np.cumsum(starts_residue) - 1, np.flatnonzero(starts_residue)
+
+    def chain_sequences(self, gaps=True):
+        """Return the one-letter sequence of every chain as a dict of uint8 
+        arrays of ASCII letters, see _chain_sequences"""
+        _, starts = self.residue_indices()
+        values = {column: self._categories[column][self._codes[column][starts]] 
+            for column in ('kind', 'resName', 'chainID')}
+        return _chain_sequences(values['chainID'], self._resSeq[starts], 
+            values['resName'], values['kind'] == 'ATOM', gaps)
+
+    def renumber_serials(self, first=1):
+        """Number the atoms first, first + 1, ... in place and return the old 
+        and new serials as arrays"""
+        old = self._serial
+        self._serial = np.arange(first, first + len(self), dtype=np.int64)
+        self._selections = {}
+        self._coordinate_selections = {}
+        return old, self._serial
+
+    def renumber_residues(self, first=1):
+        """Number the residues first, first + 1, ... in place and return the 
+        old and new resSeq of every atom as arrays"""
+        atom_residues, _ = self.residue_indices()
+        old = self._resSeq
+        self._resSeq = atom_residues + first
+        self._selections = {}
+        self._coordinate_selections = {}
+        return old, self._resSeq
+
+    def _map_categories(self, column, values_map):
+        codes, categories = _categorical([values_map(category) 
+            for category in self._categories[column].tolist()])
+        self._codes[column] = codes[self._codes[column]].astype(_code_dtype(len(categories)))
+        self._categories[column] = categories
+        # a new dict, tables of other coordinates keep the shared one
+        self._selections = {}
+        self._coordinate_selections = {}
+
+    def rename_atoms(self, names_map):
+        """Rename every atom in place by names_map, which must hold all names"""
+        self._map_categories('name', lambda name: names_map[name])
+
+    def reassign_chains(self, chains_map):
+        """Replace the chainIDs in chains_map in place, keeping the others"""
+        self._map_categories('chainID', lambda chainID: chains_map.get(chainID, chainID))
+
+
+def _as_slice(indices):
+    if len(indices) and indices[-1] - indices[0] + 1 == len(indices):
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+    return indices
+
+
+# the most masks of selections a table keeps, see PDBAtomTable.mask
+_KEPT_SELECTIONS = 64
+
+
+class Selection(object):
+
+    """Predicate on the atoms of a PDBAtomTable, compiled to a boolean mask 
+    over its columns
+
+    Selections are made by the static methods (chain, resSeq, name, 
+    element, kind, where...) and combined with &, | and ~, e.g.
+
+    Selection.chain('A') & Selection.resSeq(100, 200) & ~Selection.hydrogen()
+
+    String columns are tested on their categories and the result looked up 
+    by code, so a predicate costs one pass over an integer column. Tables 
+    keep the masks of the selections evaluated on them (PDBAtomTable.mask) 
+    until their columns are edited, and the frames of a PDBTrajectory 
+    share those of selections that do not use the coordinates, so such a 
+    selection is evaluated once. Predicates of where may use the 
+    coordinates unless declared otherwise.
+
+    Selections are equal when they select by the same values, whatever 
+    their order, or combine equal selections, so selections built again 
+    share the masks kept. Those of where are equal when their predicate is 
+    the same object.
+
+    """
+
+    def __init__(self, evaluate, description, key=None, uses_coordinates=True):
+        self._evaluate = evaluate
+        self._description = description
+        self._key = evaluate if key is None else key
+        self._uses_coordinates = uses_coordinates
+
+    uses_coordinates = property(lambda self: self._uses_coordinates)
+
+    def __eq__(self, other):
+        return type(other) == Selection and self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def evaluate(self, table):
+        """Return the mask of the selection over table, without caching"""
+        return self._evaluate(table)
+
+    def __and__(self, other):
+        return Selection(lambda table: table.mask(self) & table.mask(other), 
+            f'({self} & {other})', ('&', frozenset((self._key, other._key))), 
+            self._uses_coordinates or other._uses_coordinates)
+
+    def __or__(self, other):
+        return Selection(lambda table: table.mask(self) | table.mask(other), 
+            f'({self} | {other})', ('|', frozenset((self._key, other._key))), 
+            self._uses_coordinates or other._uses_coordinates)
+
+    def __invert__(self):
+        return Selection(lambda table: ~table.mask(self), f'~{self}', ('~', self._key), 
+            self._uses_coordinates)
+
+    def __str__(self):
+        return self._description
+
+    def __repr__(self):
+        return f'Selection({self._description})'
+
+    @staticmethod
+    def _in_column(column, values):
+        values = [values] if type(values) == str else list(values)
+
+        def evaluate(table):
+            lookup = np.isin(table.categories(column), values)
+            return lookup[table.codes(column)]
+        return Selection(evaluate, f'{column}({", ".join(map(repr, values))})', 
+            (column, frozenset(values)), False)
+
+    @staticmethod
+    def chain(*chainIDs):
+        return Selection._in_column('chainID', chainIDs)
+
+    @staticmethod
+    def name(*names):
+        return Selection._in_column('name', names)
+
+    @staticmethod
+    def resName(*resNames):
+        return Selection._in_column('resName', resNames)
+
+    @staticmethod
+    def element(*elements):
+        return Selection._in_column('element', elements)
+
+    @staticmethod
+    def kind(*kinds):
+        return Selection._in_column('kind', kinds)
+
+    @staticmethod
+    def resSeq(first, last=None):
+        """Atoms with first <= resSeq <= last (last defaults to first), or 
+        with resSeq in an IntervalSet"""
+        if isinstance(first, IntervalSet):
+            assert last is None
+            return Selection(lambda table: first.contains(table.resSeq), f'resSeq({first})', 
+                ('resSeq', tuple(first.ranges)), False)
+        last = first if last is None else last
+        return Selection(lambda table: (table.resSeq >= first) & (table.resSeq <= last), 
+            f'resSeq({first}, {last})', ('resSeq', ((first, last),)), False)
+
+    @staticmethod
+    def hydrogen():
+        return Selection.element('H')
+
+    @staticmethod
+    def backbone():
+        return Selection.name('N', 'CA', 'C', 'O')
+
+    @staticmethod
+    def all():
+        return Selection(lambda table: np.ones(len(table), dtype=bool), 'all', ('all',), False)
+
+    @staticmethod
+    def where(predicate, description=None, uses_coordinates=True):
+        """Atoms for which predicate, called with the table, gives True; 
+        if not uses_coordinates, the predicate must not read table.r, and 
+        its mask is shared by the frames of a trajectory"""
+        return Selection(predicate, description or getattr(predicate, '__name__', 'where'), 
+            uses_coordinates=uses_coordinates)
+
+
+def _format_or_blank(value, spec='.2f'):
+    return '' if np.isnan(value) else format(value, spec)
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # objects built in bulk cannot be garbage yet, but their allocation 
+    # triggers collections that traverse all of them again
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _formatted(values, format_value):
+    """Return format_value of every value as a list of strings, formatting 
+    each distinct value once so that equal values share one string"""
+    distinct, inverse = np.unique(values, return_inverse=True)
+    return np.array([format_value(value) for value in distinct.tolist()], 
+        dtype=object)[inverse.reshape(-1)].tolist()
+
+
+class _TableRowAtomLine(PDBAtomLine):
+
+    """PDBAtomLine of a row of a PDBAtomTable, whose fields come from the 
+    table already stripped and whose coordinates are formatted from the row 
+    of r the first time they are accessed"""
+
+    __slots__ = ('_r',)
+
+    def __init__(self, serial, name, altLoc, resName, chainID, resSeq, iCode, 
+        occupancy, tempFactor, element, charge, kind, r):
+        self._serial = serial
+        self._name = name
+        self._altLoc = altLoc
+        self._resName = resName
+        self._chainID = chainID
+        self._resSeq = resSeq
+        self._iCode = iCode
+        self._occupancy = occupancy
+        self._tempFactor = tempFactor
+        self._element = element
+        self._charge = charge
+        self._kind = kind
+        self._r = r
+
+    def __getattr__(self, attribute):
+        # only called for coordinates that have not been formatted yet
+        try:
+            i = ('_x', '_y', '_z').index(attribute)
+        except ValueError:
+            raise AttributeError(attribute)
+        value = f'{self._r[i]:.3f}'
+        setattr(self, attribute, value)
+        return value
+
+
+def _table_row_atom_lines(fields, rows):
+    """Return the _TableRowAtomLines of the fields of PDBAtomTable._atom_fields 
+    and the rows of r"""
+    return [_TableRowAtomLine(*row) for row in zip(*fields, rows)]
+
+
+def _pdb_file_lines(pdb_file):
+    if isinstance(pdb_file, (str, os.PathLike)):
+        with open(pdb_file, 'rb') as f:
+            yield from f
+        return
+    for line in pdb_file:
+        yield line.encode() if type(line) == str else line
+
+
+def iter_pdb_tables(pdb_file, chunk_size=None):
+
+    """Yield a PDBAtomTable per MODEL of a pdb file, reading it line by line
+
+    Arguments:
+
+    pdb_file: path or open file (text or binary) of the pdb file
+    chunk_size: if given, a model is further split into tables of at most 
+    chunk_size atoms
+
+    Only the records of the table being built are held in memory, so files 
+    of many models can be processed in memory proportional to one model.
+    A file without MODEL records is yielded as a single model.
+
+    """
+    assert chunk_size is None or chunk_size > 0
+    records = []
+    for line in _pdb_file_lines(pdb_file):
+        if line[:6] in (b'ATOM  ', b'HETATM'):
+            records.append(line.rstrip(b'\r\n'))
+            if len(records) == chunk_size:
+                yield PDBAtomTable.for_records(records)
+                records = []
+        elif line[:6] == b'ENDMDL' and records:
+            yield PDBAtomTable.for_records(records)
+            records = []
+    if records:
+        yield PDBAtomTable.for_records(records)
+
+
+def iter_pdb_models(pdb_file, chunk_size=None):
+    """Yield a PDBProtein per MODEL (or chunk of atoms) of a pdb file. See 
+    iter_pdb_tables"""
+    for table in iter_pdb_tables(pdb_file, chunk_size):
+        yield PDBProtein.from_table(table)
+
+
+def _file_fingerprint(path, use_hash):
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if use_hash:
+        with open(path, 'rb') as f:
+            fingerprint['sha1'] = hashlib.sha1(f.read()).hexdigest()
+    return fingerprint
+
+
+def read_pdb_table(path, cache_dir='~/Proteins/cache', use_hash=False):
+
+    """Return the PDBAtomTable of a pdb file, from a binary cache if the 
+    file is unchanged since it was cached
+
+    Arguments:
+
+    path: path of the pdb file
+    cache_dir: directory of the cache; None reads the file without caching
+    use_hash: if True, a cached table is only reused when the SHA-1 of the 
+    file also matches; otherwise its size and mtime must match
+
+    Cached tables are .npz files of the table columns named after the 
+    absolute path of the source, and load without parsing any text.
+
+    """
+    if cache_dir is None:
+        return PDBAtomTable.parse_file(path)
+    cache_dir = os.path.expanduser(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+    cache_path = os.path.join(cache_dir, f'{key}.npz')
+    fingerprint = _file_fingerprint(path, use_hash)
+
+    try:
+        table, metadata = PDBAtomTable.load(cache_path)
+        if all(name in metadata and metadata[name] == value for name, value in fingerprint.items()):
+            return table
+    except (OSError, ValueError, KeyError):
+        pass
+
+    table = PDBAtomTable.parse_file(path)
+    # write to a temporary file first so readers never see a partial cache
+    handle, temporary_path = tempfile.mkstemp(dir=cache_dir, suffix='.npz')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            table.save(f, **fingerprint)
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        os.remove(temporary_path)
+        raise
+    return table
+
+
+class PDBLoadResult(object):
+
+    """Outcome of loading one file with load_pdb_files: the structure read 
+    from path, or the exception raised reading it"""
+
+    def __init__(self, path, structure=None, error=None):
+        self._path = path
+        self._structure = structure
+        self._error = error
+
+    path = property(lambda self: self._path)
+    structure = property(lambda self: self._structure)
+    error = property(lambda self: self._error)
+    ok = property(lambda self: self._error is None)
+
+
+def _load_pdb_files(paths, read, processes, progress, convert=None):
+    # read is called with each path, in this process or in a worker, and 
+    # convert, if given, with what it returned, in this process
+    paths = list(paths)
+    results = [None] * len(paths)
+    done = 0
+
+    def finish(i, structure, error):
+        nonlocal done
+        if convert and structure is not None:
+            structure = convert(structure)
+        results[i] = PDBLoadResult(paths[i], structure, error)
+        done += 1
+        if progress:
+            progress(done, len(paths), paths[i])
+
+    if processes == 1:
+        for i, path in enumerate(paths):
+            try:
+                finish(i, read(path), None)
+            except Exception as error:
+                finish(i, None, error)
+        return results
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(read, path): i for i, path in enumerate(paths)}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                finish(futures[future], future.result(), None)
+            except Exception as error:
+                finish(futures[future], None, error)
+    return results
+
+
+def load_pdb_files(paths, processes=None, as_tables=False, progress=None, cache_dir=None):
+
+    """Return a PDBLoadResult per path, in the order of paths, parsing the 
+    files in a pool of processes
+
+    Arguments:
+
+    paths: paths of pdb files
+    processes: number of worker processes (default: os.cpu_count()); 1 
+    parses in this process
+    as_tables: if True the structures are PDBAtomTables, else PDBProteins
+    progress: optional callable, called as progress(done, total, path) 
+    each time a file is finished
+    cache_dir: if given, files are read through the cache of read_pdb_table
+
+    Workers send back PDBAtomTables, whose column arrays pickle cheaply. 
+    For proteins they also convert the columns to the strings of the atom 
+    lines and group the atoms by residue (see _protein_fields), so this 
+    process only creates the atom and residue objects; that part cannot be 
+    spread over processes and bounds how loading proteins scales with them, 
+    which loading tables does not have. A file that cannot be read gives a 
+    result with its error instead of stopping the batch.
+
+    """
+    if as_tables:
+        return _load_pdb_files(paths, functools.partial(read_pdb_table, cache_dir=cache_dir), 
+            processes, progress)
+    return _load_pdb_files(paths, functools.partial(_read_protein_fields, cache_dir=cache_dir), 
+        processes, progress, lambda fields: PDBProtein._from_fields(*fields))
+
+
+def _read_protein_fields(path, cache_dir):
+    return _protein_fields(read_pdb_table(path, cache_dir))
+
+
+def _read_chain_sequences(path, cache_dir, gaps):
+    return read_pdb_table(path, cache_dir).chain_sequences(gaps)
+
+
+def load_pdb_sequences(paths, processes=None, gaps=True, progress=None, cache_dir=None):
+    """Return a PDBLoadResult per path like load_pdb_files, whose structure 
+    is the dict of chain sequences of PDBAtomTable.chain_sequences; only the 
+    sequences are sent back by the workers"""
+    return _load_pdb_files(paths, functools.partial(_read_chain_sequences, 
+        cache_dir=cache_dir, gaps=gaps), processes, progress)
+
+
+class LazyPDBAtomLine(PDBAtomLine):
+
+    """PDBAtomLine over an ATOM/HETATM record in a buffer (e.g. a mmap) that 
+    decodes each field the first time it is accessed"""
+
+    __slots__ = ('_buffer', '_start', '_end')
+
+    _field_columns = {
+        '_serial': (6, 11),
+        '_name': (12, 16),
+        '_altLoc': (16, 17),
+        '_resName': (17, 21),
+        '_chainID': (21, 22),
+        '_resSeq': (22, 26),
+        '_iCode': (26, 27),
+        '_x': (30, 38),
+        '_y': (38, 46),
+        '_z': (46, 54),
+        '_occupancy': (54, 60),
+        '_tempFactor': (60, 66),
+        '_element': (76, 78),
+        '_charge': (78, None),
+        '_kind': (0, 6),
+    }
+
+    def __init__(self, buffer, start, end):
+        self._buffer = buffer
+        self._start = start
+        self._end = end
+
+    def __getattr__(self, attribute):
+        # only called for fields that have not been decoded yet
+        try:
+            first, last = LazyPDBAtomLine._field_columns[attribute]
+        except KeyError:
+            raise AttributeError(attribute)
+        first += self._start
+        last = self._end if last is None else min(self._start + last, self._end)
+        value = sys.intern(bytes(self._buffer[first:last]).decode().strip()) if first < last else ''
+        setattr(self, attribute, value)
+        return value
+
+
+class MappedPDBFile(object):
+
+    """Memory-mapped pdb file with an index of its record offsets
+
+    Opening the file only locates the ATOM/HETATM, HELIX and MODEL records; 
+    atom fields are decoded by LazyPDBAtomLine when they are used, so 
+    selecting a chain of a model only decodes the records of that chain.
+    Lines and proteins returned read from the map, so keep the file open 
+    while they are in use.
+
+    Usage:
+
+    with MappedPDBFile('1abc.pdb') as pdb_file:
+        chain_a = pdb_file.protein(chainID='A')
+
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        data = np.frombuffer(self._map, dtype=np.uint8)
+
+        atom_starts, atom_ends, helix_starts, helix_ends, model_starts = [], [], [], [], []
+        for starts, ends in _line_bounds(data):
+            record_names = _record_names(data, starts, ends)
+            is_atom = (record_names == b'ATOM  ') | (record_names == b'HETATM')
+            is_helix = record_names == b'HELIX '
+            atom_starts.append(starts[is_atom])
+            atom_ends.append(ends[is_atom])
+            helix_starts.append(starts[is_helix])
+            helix_ends.append(ends[is_helix])
+            model_starts.append(starts[record_names == b'MODEL '])
+        self._atom_starts, self._atom_ends, self._helix_starts, self._helix_ends, \
+            model_starts = [np.concatenate(offsets + [np.array([], dtype=np.int64)]) for offsets in 
+                (atom_starts, atom_ends, helix_starts, helix_ends, model_starts)]
+        self._atom_models = np.maximum(
+            np.searchsorted(model_starts, self._atom_starts) - 1, 0)
+        self._model_count = max(len(model_starts), 1 if len(self._atom_starts) else 0)
+        chain_columns = self._atom_starts + 21
+        self._atom_chainIDs = np.where(chain_columns < self._atom_ends, 
+            data[np.minimum(chain_columns, max(len(data) - 1, 0))], ord(' ')
+        ).astype(np.uint8).view('S1')
+
+    model_count = property(lambda self: self._model_count)
+
+    def __len__(self):
+        return len(self._atom_starts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if type(self._map) == mmap.mmap:
+            self._map.close()
+        self._file.close()
+
+    def atom_line(self, i):
+        return LazyPDBAtomLine(self._map, int(self._atom_starts[i]), int(self._atom_ends[i]))
+
+    def atom_indices(self, chainID=None, model=None):
+        """Return the indices of the atoms of a chain and/or model (counted 
+        from 0) without decoding them"""
+        mask = np.ones(len(self), dtype=bool)
+        if chainID is not None:
+            mask &= self._atom_chainIDs == (chainID or ' ').encode()
+        if model is not None:
+            mask &= self._atom_models == model
+        return np.flatnonzero(mask)
+
+    def atom_lines(self, chainID=None, model=None):
+        return [self.atom_line(i) for i in self.atom_indices(chainID, model)]
+
+    def helix_lines(self):
+        return [PDBHelixLine.parse_string(bytes(self._map[start:end]).decode()) 
+            for start, end in zip(self._helix_starts, self._helix_ends)]
+
+    def protein(self, chainID=None, model=None):
+        return PDBProtein(self.atom_lines(chainID, model))
+
+
+def _line_bounds(data, window_size=1 << 22):
+    """Yield the start and end offsets of the non-empty lines of data, 
+    without their line breaks, as arrays, a window of window_size bytes at 
+    a time so that finding them takes memory proportional to the window"""
+    line_start = 0
+    for window_start in range(0, len(data), window_size):
+        window_stop = min(window_start + window_size, len(data))
+        newlines = np.flatnonzero(data[window_start:window_stop] == ord('\n')) + window_start
+        if window_stop == len(data):
+            newlines = np.append(newlines, len(data))
+        if not len(newlines):
+            continue
+        starts = np.concatenate(([line_start], newlines[:-1] + 1))
+        ends = newlines
+        line_start = int(newlines[-1]) + 1
+        keep = starts < ends
+        starts, ends = starts[keep], ends[keep]
+        ends[data[ends - 1] == ord('\r')] -= 1
+        yield starts, ends
+
+
+def _record_names(data, starts, ends):
+    """Return the 6-character record names of the lines between starts and 
+    ends as an 'S6' array, padding short lines with spaces"""
+    columns = starts[:, np.newaxis] + np.arange(6)
+    in_line = columns < ends[:, np.newaxis]
+    names = np.full(columns.shape, ord(' '), dtype=np.uint8)
+    names[in_line] = data[columns[in_line]]
+    return names.view('S6').ravel()
+
+
+class CellList(object):
+
+    """Spatial index of points binned into cubic cells of side cell_size
+
+    Points are sorted by cell so the points of a cell are a contiguous run; 
+    a query only measures distances to the points of the cells that 
+    overlap a sphere of radius d around each query point.
+
+    """
+
+    def __init__(self, points, cell_size=4.0):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        assert(cell_size > 0)
+        self._points = points
+        self._cell_size = cell_size
+        self._origin = points.min(axis=0) if len(points) else np.zeros(3)
+        cells = self._cells_of(points)
+        self._shape = cells.max(axis=0) + 1 if len(points) else np.ones(3, dtype=np.int64)
+        keys = self._keys_of(cells)
+        self._order = np.argsort(keys, kind='stable')
+        self._cell_keys, self._cell_starts, self._cell_counts = np.unique(
+            keys[self._order], return_index=True, return_counts=True)
+
+    points = property(lambda self: self._points)
+    cell_size = property(lambda self: self._cell_size)
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cells_of(self, points):
+        return np.floor((points - self._origin) / self._cell_size).astype(np.int64)
+
+    def _keys_of(self, cells):
+        return (cells[:, 0] * self._shape[1] + cells[:, 1]) * self._shape[2] + cells[:, 2]
+
+    def pairs_within(self, d, points):
+        """Return arrays (i, j) of every query point points[i] closer than d 
+        to indexed point self.points[j]"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if not len(points) or not len(self._points):
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        reach = int(np.ceil(d / self._cell_size))
+        steps = np.arange(-reach, reach + 1)
+        offsets = np.stack(np.meshgrid(steps, steps, steps, indexing='ij'), axis=-1).reshape(-1, 3)
+
+        neighbours = self._cells_of(points)[:, np.newaxis, :] + offsets
+        inside = np.all((neighbours >= 0) & (neighbours < self._shape), axis=-1)
+        query, _ = np.nonzero(inside)
+        keys = self._keys_of(neighbours[inside])
+        slots = np.minimum(np.searchsorted(self._cell_keys, keys), len(self._cell_keys) - 1)
+        occupied = self._cell_keys[slots] == keys
+        query, slots = query[occupied], slots[occupied]
+
+        # expand every (query point, cell) into (query point, point in cell)
+        counts = self._cell_counts[slots]
+        query = np.repeat(query, counts)
+        run_starts = np.repeat(self._cell_starts[slots] - np.cumsum(counts) + counts, counts)
+        candidates = self._order[run_starts + np.arange(len(query))]
+
+        is_close = np.sum((points[query] - self._points[candidates]) ** 2, axis=1) < d * d
+        return query[is_close], candidates[is_close]
+
+    def any_within(self, d, points):
+        """Return whether any query point is closer than d to an indexed point"""
+        return len(self.pairs_within(d, points)[0]) > 0
+
+
+def _minimum_by_key(keys, values):
+    """Return the sorted unique keys and the minimum of the values of each"""
+    order = np.argsort(keys, kind='stable')
+    keys, values = keys[order], values[order]
+    unique_keys, starts = np.unique(keys, return_index=True)
+    return unique_keys, np.minimum.reduceat(values, starts) if len(keys) else values
+
+
+def _residue_contacts(points, point_residues, chainIDs, resSeqs, d, block_size):
+    """Return the structured array of PDBProtein.residue_contacts for points 
+    belonging to residues point_residues, indices into chainIDs and resSeqs"""
+    assert(block_size > 0)
+    # cells as wide as the cutoff keep the search to adjacent cells
+    index = CellList(points, cell_size=max(d, 1.0))
+    residue_count = len(chainIDs)
+    keys, distances = [np.array([], dtype=np.int64)], [np.array([])]
+    for start in range(0, len(index), block_size):
+        block = index.points[start:start + block_size]
+        i, j = index.pairs_within(d, block)
+        i += start
+        residue1 = point_residues[i]
+        residue2 = point_residues[j]
+        between = residue1 < residue2
+        i, j = i[between], j[between]
+        keys.append(residue1[between] * residue_count + residue2[between])
+        distances.append(np.linalg.norm(index.points[i] - index.points[j], axis=1))
+    pair_keys, pair_distances = _minimum_by_key(np.concatenate(keys), np.concatenate(distances))
+
+    contacts = np.empty(len(pair_keys), dtype=[('residue1', np.int64), 
+        ('residue2', np.int64), ('chainID1', chainIDs.dtype), ('resSeq1', np.int64), 
+        ('chainID2', chainIDs.dtype), ('resSeq2', np.int64), ('distance', np.float64)])
+    contacts['residue1'], contacts['residue2'] = np.divmod(pair_keys, max(residue_count, 1))
+    contacts['chainID1'] = chainIDs[contacts['residue1']]
+    contacts['resSeq1'] = resSeqs[contacts['residue1']]
+    contacts['chainID2'] = chainIDs[contacts['residue2']]
+    contacts['resSeq2'] = resSeqs[contacts['residue2']]
+    contacts['distance'] = pair_distances
+    return contacts
+
+
+def _protein_fields(table):
+
+    """Return what PDBProtein.from_table builds a protein of: the fields of 
+    the atom lines as lists of strings (see PDBAtomTable._atom_fields), r, 
+    the order of the atoms grouped by residue and the bounds of the residues 
+    in that order
+
+    Residues are grouped by resSeq in the order of their first atom, as 
+    PDBProtein.__init__ groups them. Everything returned pickles cheaply, 
+    so the work of building a protein that creates no atom objects can be 
+    done in another process.
+
+    """
+    _, first, inverse = np.unique(table.resSeq, return_index=True, return_inverse=True)
+    first = first[inverse.reshape(-1)]
+    order = np.argsort(first, kind='stable')
+    bounds = np.flatnonzero(first[order][1:] != first[order][:-1]) + 1
+    return table._atom_fields(), table.r, order.tolist(), [0] + bounds.tolist(), \
+        bounds.tolist() + [len(table)]
+
+
+def _heavy_atom_coordinates(atoms):
+    return np.array([atom.r for atom in atoms if not atom.is_hydrogen()]).reshape(-1, 3)
+
+
+_sequence_letters = np.frombuffer(''.join(amino_acid_letters).encode('ascii'), dtype=np.uint8)
+
+
+def _chain_sequences(chainIDs, resSeqs, resNames, is_atom, gaps):
+
+    """Return the one-letter sequence of every chain as a dict of uint8 
+    arrays of ASCII letters, chains in order of appearance
+
+    Arguments are per residue, in the order of the structure. Residues of 
+    ATOM records that are not amino acids are 'X'; those of HETATM records 
+    are left out unless they are amino acids. If gaps, every resSeq missing 
+    between two residues of a chain gives a '-'.
+
+    """
+    codes = amino_acid_codes(resNames)
+    kept = is_atom | (codes != UNKNOWN_AMINO_ACID)
+    chainIDs, resSeqs, letters = chainIDs[kept], resSeqs[kept], _sequence_letters[codes[kept]]
+    _, first = np.unique(chainIDs, return_index=True)
+    sequences = {}
+    for chainID in chainIDs[np.sort(first)].tolist():
+        in_chain = chainIDs == chainID
+        sequence = letters[in_chain]
+        if gaps and len(sequence) > 1:
+            missing = np.maximum(np.diff(resSeqs[in_chain]) - 1, 0)
+            positions = np.arange(len(sequence))
+            positions[1:] += np.cumsum(missing)
+            sequence = np.full(positions[-1] + 1, ord('-'), dtype=np.uint8)
+            sequence[positions] = letters[in_chain]
+        sequences[chainID] = sequence
+    return sequences
+
+
 class PDBProtein(object):
     def __init__(self, atoms_lines, forces=np.array([]), reindex_map=None, first_reindex=1):
         if reindex_map != None:
             assert(type(reindex_map) == dict)
             assert(len(reindex_map) == 0)
 
-        does_have_forces = forces.size > 0
-        if does_have_forces:
-            assert(type(forces) == np.ndarray)
-            assert(forces.shape == (len(atoms), 3))
-        
         residues = {}
+        positions = {}
+        file_atoms = []
         for i, atom_line in enumerate(atoms_lines):
-            new_index = atom_line.serial
+            atom_line_copy = atom_line
             if reindex_map != None:
                 new_index = f'{i+first_reindex}'
                 reindex_map[f'{atom_line.resSeq}:{atom_line.name}'] = (atom_line.serial, new_index)
-            atom_line_copy = atom_line.copy_with(serial=new_index)
-            atom = PDBAtom(atom_line_copy, forces[i]) if does_have_forces else PDBAtom(atom_line_copy)
+                atom_line_copy = atom_line.copy_with(serial=new_index)
+            atom = PDBAtom(atom_line_copy)
+            file_atoms.append(atom)
             res_atoms = residues.get(atom.resSeq, [])
             res_atoms.append(atom)
             residues[atom.resSeq] = res_atoms
+            positions.setdefault(atom.resSeq, []).append(i)
         self._residues = {k:PDBResidue(v) for (k, v) in residues.items()}
+        # the atoms in the order of atoms_lines, which self.atoms groups by resSeq
+        self._file_atoms = file_atoms
+        self._atom_index = None
+        self._forces = None
+        # sums of the forces, dropped when the forces change
+        self._force_sums = {}
+        self._sequences = {}
+        self._table = None
+        # the lines are the caller's until edits copy them
+        self._lines_copied = reindex_map != None
+        if forces.size > 0:
+            # forces are given in the order of atoms_lines, atoms are grouped by residue
+            assert(type(forces) == np.ndarray)
+            assert(forces.shape == (sum(len(v) for v in positions.values()), 3))
+            self.set_forces(forces[[i for v in positions.values() for i in v]])
+
+    @classmethod
+    def from_table(cls, table, forces=np.array([])):
+        """Return a protein built from a PDBAtomTable, without reparsing 
+        the coordinates of its atoms"""
+        assert(type(table) == PDBAtomTable)
+        return cls._from_fields(*_protein_fields(table), forces=forces)
+
+    @classmethod
+    def _from_fields(cls, fields, r, order, starts, stops, forces=np.array([])):
+        # builds the objects of a protein from what _protein_fields returned
+        protein = cls([])
+        rows = list(r)
+        with _gc_paused():
+            protein._file_atoms = [PDBAtom(atom_line, r=row) 
+                for atom_line, row in zip(_table_row_atom_lines(fields, rows), rows)]
+            atoms = [protein._file_atoms[i] for i in order]
+            protein._residues = {atoms[start].resSeq: PDBResidue(atoms[start:stop]) 
+                for start, stop in zip(starts, stops) if start < stop}
+        protein._lines_copied = True
+        if forces.size > 0:
+            assert(forces.shape == (len(r), 3))
+            protein.set_forces(forces[order])
+        return protein
     
     residues = property(lambda self: list(self._residues.values()))
     residues_dict = property(lambda self: self._residues)
+    atoms = property(lambda self: [atom for residue in self.residues for atom in residue.atoms])
+    forces = property(lambda self: self._forces)
+
+    def set_forces(self, forces):
+        """Set the (N, 3) forces on the atoms, in the order of self.atoms
+
+        The protein keeps the array; residues and atoms get views of their 
+        rows, so per-residue sums are taken from one array, and forces set 
+        on an atom are written to its row.
+
+        """
+        assert(type(forces) == np.ndarray)
+        residues = self.residues
+        counts = [len(residue.atoms) for residue in residues]
+        assert(forces.shape == (sum(counts), 3))
+        self._forces = np.ascontiguousarray(forces, dtype=np.float64)
+        self._force_sums = {}
+        start = 0
+        for residue, count in zip(residues, counts):
+            residue.set_forces(self._forces[start:start + count], self._force_sums)
+            start += count
+
+    def sum_by_residue(self, values):
+        """Return per-residue sums of per-atom values
+
+        values: array of shape (..., N, k), e.g. (N, 3) forces of one frame or 
+        (F, N, 3) forces of F frames, with atoms in the order of self.atoms
+
+        Returns an array of shape (..., len(self.residues), k) computed with 
+        one np.add.reduceat.
+
+        """
+        counts = np.array([len(residue.atoms) for residue in self.residues], dtype=np.int64)
+        assert(values.shape[-2] == counts.sum())
+        sums = np.zeros(values.shape[:-2] + (len(counts), values.shape[-1]))
+        if not counts.sum():
+            return sums
+        starts = np.cumsum(counts) - counts
+        # reduceat cannot give empty sums, residues without atoms stay zero
+        has_atoms = counts > 0
+        sums[..., has_atoms, :] = np.add.reduceat(values, starts[has_atoms], axis=-2)
+        return sums
+
+    def residue_forces(self):
+        """Return the (len(self.residues), 3) sums of the atom forces of each 
+        residue, cached until the forces are set on the protein or an atom; 
+        edits of self.forces in place are not seen, set_forces after them"""
+        assert self._forces is not None, 'protein has no forces'
+        if 'residues' not in self._force_sums:
+            self._force_sums['residues'] = self.sum_by_residue(self._forces)
+        return self._force_sums['residues']
+
+    def chain_forces(self):
+        """Return the chainIDs of the protein and the (chains, 3) sums of the 
+        atom forces of each"""
+        assert self._forces is not None, 'protein has no forces'
+        # by atom, a residue of self.residues may hold atoms of several chains
+        chainIDs, chain_of_atom = np.unique(
+            np.array([atom.chainID for atom in self.atoms], dtype=str), return_inverse=True)
+        sums = np.zeros((len(chainIDs), 3))
+        np.add.at(sums, chain_of_atom.reshape(-1), self._forces)
+        return chainIDs, sums
+
+    def select_atoms(self, selection):
+        """Return the atoms of self.atoms in a Selection, evaluated on a table 
+        of the atoms built once and kept until atoms are edited
+
+        Edits of the protein drop the table. Residues and atoms edited on 
+        their own replace or reorder atom lines, so the table is also built 
+        again when the lines of the atoms are no longer those it was built 
+        from.
+
+        """
+        atoms = self.atoms
+        lines = [atom.atom_line for atom in atoms]
+        if self._table is None or len(self._table[0]) != len(lines) or \
+            any(line is not kept for line, kept in zip(lines, self._table[0])):
+            self._table = (lines, PDBAtomTable.for_atoms(atoms))
+        return [atoms[i] for i in np.flatnonzero(self._table[1].mask(selection)).tolist()]
 
     def strip_hydrogens(self):
+        self._table = None
+        forces = self._forces
+        if forces is not None:
+            forces = forces[[not atom.is_hydrogen() for atom in self.atoms]]
         for residue in self.residues:
             residue.strip_hydrogens()
+        if forces is not None:
+            self.set_forces(forces)
+
+    def chain_sequences(self, gaps=True):
+        """Return the one-letter sequence of every chain as a dict of uint8 
+        arrays of ASCII letters, computed once and kept until atoms are 
+        edited; see _chain_sequences for gaps
+
+        Residues are taken in the order of the lines the protein was built 
+        from, as a PDBAtomTable takes them; self.atoms groups the residues 
+        of all chains by resSeq instead.
+
+        """
+        if gaps not in self._sequences:
+            atoms = self.atoms
+            if len(atoms) != len(self._file_atoms):
+                # atoms were stripped since
+                kept = set(map(id, atoms))
+                atoms = [atom for atom in self._file_atoms if id(atom) in kept]
+            else:
+                atoms = self._file_atoms
+            lines = [atom.atom_line for atom in atoms]
+            residues = [(line.chainID, line.resSeq, line.iCode, line.resName, line.kind) 
+                for line in lines]
+            # atoms of one residue are consecutive, residues of one resSeq in 
+            # different chains may be in one PDBResidue
+            residues = [residue for i, residue in enumerate(residues) 
+                if i == 0 or residue[:3] != residues[i - 1][:3]]
+            chainIDs, resSeqs, _, resNames, kinds = (np.array(column, dtype=str) 
+                for column in zip(*residues)) if residues else [np.array([], dtype=str)] * 5
+            self._sequences[gaps] = _chain_sequences(chainIDs, _hybrid36_integers(resSeqs, 4), 
+                resNames, kinds == 'ATOM', gaps)
+        return self._sequences[gaps]
+
+    def chain_sequence_strings(self, gaps=True):
+        """Return the sequences of chain_sequences as strings"""
+        return {chainID: sequence.tobytes().decode('ascii') 
+            for chainID, sequence in self.chain_sequences(gaps).items()}
+
+    def _set_atom_fields(self, field, values):
+        # lines are updated in place rather than copied per edit, once they 
+        # are copied from those the protein was built from
+        attribute = f'_{field}'
+        self._sequences = {}
+        self._table = None
+        atoms = self.atoms
+        if not self._lines_copied:
+            for atom in atoms:
+                atom._atom_line = atom.atom_line.copy_with()
+            self._lines_copied = True
+        for atom, value in zip(atoms, values):
+            setattr(atom.atom_line, attribute, value)
+
+    def _map_atom_field(self, field, values_map):
+        values = np.array([getattr(atom, field) for atom in self.atoms], dtype=str)
+        distinct, inverse = np.unique(values, return_inverse=True)
+        mapped = [sys.intern(values_map(value)) for value in distinct.tolist()]
+        self._set_atom_fields(field, [mapped[i] for i in inverse.tolist()])
 
     def rename_atoms(self, names_map):
-        for residue in self.residues:
-            residue.rename_atoms(names_map)
+        """Rename every atom in place by names_map, which must hold all names"""
+        self._map_atom_field('name', lambda name: names_map[name])
+
+    def reassign_chains(self, chains_map):
+        """Replace the chainIDs in chains_map in place, keeping the others"""
+        self._map_atom_field('chainID', lambda chainID: chains_map.get(chainID, chainID))
+
+    def renumber_serials(self, first=1):
+        """Number the atoms of self.atoms first, first + 1, ... in place and 
+        return the old and new serials as integer arrays, the reindex map of 
+        the atoms by position"""
+        atoms = self.atoms
+        old = _hybrid36_integers([atom.serial for atom in atoms], 5)
+        new = np.arange(first, first + len(atoms), dtype=np.int64)
+        self._set_atom_fields('serial', [sys.intern(serial) for serial in _hybrid36_strings(new, 5)])
+        return old, new
+
+    def renumber_residues(self, first=1):
+        """Number the residues of self.residues first, first + 1, ... in 
+        place and return the old and new resSeq of every residue as integer 
+        arrays"""
+        residues = self.residues
+        old = _hybrid36_integers([residue.resSeq for residue in residues], 4)
+        new = np.arange(first, first + len(residues), dtype=np.int64)
+        resSeqs = [sys.intern(resSeq) for resSeq in _hybrid36_strings(new, 4)]
+        self._set_atom_fields('resSeq', [resSeq for residue, resSeq in zip(residues, resSeqs) 
+            for _ in residue.atoms])
+        self._residues = {resSeq: residue for resSeq, residue in zip(resSeqs, residues)}
+        return old, new
+
+    @property
+    def atom_index(self):
+        """CellList of the heavy atoms of the protein, built on first use"""
+        if self._atom_index is None:
+            heavy_atoms = [(i, atom) for i, residue in enumerate(self.residues) 
+                for atom in residue.atoms if not atom.is_hydrogen()]
+            self._heavy_atoms = [atom for _, atom in heavy_atoms]
+            self._heavy_atom_residues = np.array([i for i, _ in heavy_atoms], dtype=np.int64)
+            self._atom_index = CellList(np.array([atom.r for atom in self._heavy_atoms]))
+        return self._atom_index
+
+    def atoms_closer_than(self, d, residue):
+        """Return the heavy atoms closer than d to any heavy atom of residue"""
+        _, found = self.atom_index.pairs_within(d, _heavy_atom_coordinates(residue.atoms))
+        return [self._heavy_atoms[i] for i in np.unique(found)]
+
+    def residues_closer_than(self, d, residue):
+        """Return the residues with a heavy atom closer than d to any heavy 
+        atom of residue"""
+        _, found = self.atom_index.pairs_within(d, _heavy_atom_coordinates(residue.atoms))
+        residues = self.residues
+        return [residues[i] for i in np.unique(self._heavy_atom_residues[found])]
 
     def is_closer_than(self, d, residue):
-        for this_residue in self.residues:
-            if this_residue.is_closer_than(d, residue):
-                return True
-        return False
+        return self.atom_index.any_within(d, _heavy_atom_coordinates(residue.atoms))
+
+    def residue_contacts(self, d, block_size=8192):
+
+        """Return the pairs of residues with heavy atoms closer than d
+
+        Arguments:
+
+        d: the distance cutoff
+        block_size: number of heavy atoms whose neighbours are searched at a 
+        time, which bounds the memory used for candidate atom pairs
+
+        Residues are the atoms of one chainID, resSeq and iCode (so residues 
+        of one resSeq in different chains are apart, unlike in 
+        self.residues), numbered in the order of their first atom in 
+        self.atoms. Returns a structured array with a row per pair of 
+        residues, ordered by 'residue1' < 'residue2', their numbers, with 
+        their 'chainID1', 'resSeq1', 'chainID2', 'resSeq2' and the minimum 
+        heavy atom 'distance' between them.
+
+        """
+        atoms = self.atoms
+        residue_numbers = {}
+        atom_residues = np.array([residue_numbers.setdefault(
+            (atom.chainID, atom.resSeq, atom.atom_line.iCode), len(residue_numbers)) 
+            for atom in atoms], dtype=np.int64)
+        is_heavy = np.array([not atom.is_hydrogen() for atom in atoms], dtype=bool)
+        residues = list(residue_numbers)
+        return _residue_contacts(self.atom_index.points, atom_residues[is_heavy], 
+            np.array([chainID for chainID, _, _ in residues], dtype=str), 
+            _hybrid36_integers([resSeq for _, resSeq, _ in residues], 4), 
+            d, block_size)
 
     def __str__(self):
-        return '\n'.join(f"{residue_out}" for residue_out in [str(residue) for residue in self.residues])
+        return '\n'.join(format_pdb_records(self))
 
 
 @functools.total_ordering
 class PDBResidue(object):
+    __slots__ = ('_atoms', '_forces')
+
     def __init__(self, atoms, forces=np.array([])):
         assert(type(atoms[0]) == PDBAtom)
-        if forces.size > 0:
-            assert(type(forces) == np.ndarray)
-            assert(forces.shape == (len(atoms), 3))
-            for i,force in enumerate(forces):
-                atoms[i].set_force(force)
         self._atoms = atoms
+        self._forces = None
+        if forces.size > 0:
+            self.set_forces(forces)
+
+    def set_forces(self, forces, force_sums=None):
+        # atoms get views of the rows; force_sums are the sums the forces 
+        # set on them make stale
+        assert(type(forces) == np.ndarray)
+        assert(forces.shape == (len(self._atoms), 3))
+        self._forces = forces
+        force_sums = {} if force_sums is None else force_sums
+        for atom in self._atoms:
+            atom._force_sums = force_sums
+        self._point_atoms_at_forces()
+
+    def _point_atoms_at_forces(self):
+        for atom, force in zip(self._atoms, self._forces):
+            atom._force = force
+
+    def _force(self):
+        if self._forces is not None:
+            return self._forces.sum(axis=0)
+        return np.sum(np.array([atom.force for atom in self._atoms]), axis=0)
 
     atoms = property(lambda self: self._atoms)
-    force = property(lambda self: np.sum(np.array([atom.force for atom in self._atoms]), axis=0))
+    forces = property(lambda self: self._forces)
+    force = property(_force)
     resSeq = property(lambda self: self._atoms[0].resSeq)
     resName = property(lambda self: self._atoms[0].resName)
     chainID = property(lambda self: self._atoms[0].chainID)
 
     def strip_hydrogens(self):
-        self._atoms = [atom for atom in self._atoms if not atom.is_hydrogen()]
+        is_heavy = [not atom.is_hydrogen() for atom in self._atoms]
+        self._atoms = [atom for atom, keep in zip(self._atoms, is_heavy) if keep]
+        if self._forces is not None:
+            self._forces = self._forces[is_heavy]
+            self._point_atoms_at_forces()
 
     def reorder_by_names(self, names):
         assert(len(names) == len(self._atoms))
-        atom_by_name = {atom.name : atom for atom in self._atoms}
+        position_by_name = {atom.name : i for i, atom in enumerate(self._atoms)}
         try:
-            self._atoms = [atom_by_name[name] for name in names]
-        finally:
+            order = [position_by_name[name] for name in names]
+        except KeyError:
             return
+        self._atoms = [self._atoms[i] for i in order]
+        if self._forces is not None:
+            # permute in place so a protein's force array stays aligned
+            self._forces[:] = self._forces[order]
+            self._point_atoms_at_forces()
 
     def rename_atoms(self, names_map):
         for atom in self._atoms:
             atom.set_name(names_map[atom.name])
 
     def is_closer_than(self, d, residue):
-        for atom in self._atoms:
-            if atom.is_hydrogen(): 
-                continue
-            for residue_atom in residue.atoms:
-                if residue_atom.is_hydrogen():
-                    continue
-                if atom.distance_to(residue_atom) < d:
-                    return True
-        return False
+        these = _heavy_atom_coordinates(self._atoms)
+        those = _heavy_atom_coordinates(residue.atoms)
+        squared_distances = np.sum((these[:, np.newaxis, :] - those) ** 2, axis=-1)
+        return bool(np.any(squared_distances < d * d))
 
     def atoms_by_name(self, has_hydrogens=True):
         return {atom.name:atom for atom in self._atoms if (has_hydrogens or not atom.is_hydrogen())}
@@ -391,29 +1831,43 @@ class PDBResidue(object):
 
 
 class PDBAtom(object):
-    def __init__(self, atom_line, force=np.zeros(3)):
+    __slots__ = ('_atom_line', '_force', '_r', '_force_sums')
+
+    def __init__(self, atom_line, force=np.zeros(3), r=None):
         self._atom_line = atom_line
         self._force = force
-        self._r = np.array([float(self._atom_line.x), float(self._atom_line.y), float(self._atom_line.z)])
+        self._r = r
+        self._force_sums = None
     
+    @property
+    def r(self):
+        # coordinates are parsed on first use so lazily decoded lines stay lazy
+        if self._r is None:
+            self._r = np.array([float(self._atom_line.x), float(self._atom_line.y), float(self._atom_line.z)])
+        return self._r
+
     def set_force(self, force):
         assert(type(force) == np.ndarray)
         assert(force.dtype == np.float64)
-        self._force = force
+        if self._force_sums is None:
+            self._force = force
+        else:
+            # a row of the forces of a residue, which its sums must see
+            self._force[:] = force
+            self._force_sums.clear()
     
+    atom_line = property(lambda self: self._atom_line)
     name = property(lambda self: self._atom_line.name)
     force = property(lambda self: self._force, set_force)
     resSeq = property(lambda self: self._atom_line.resSeq)
     resName = property(lambda self: self._atom_line.resName)
     chainID = property(lambda self: self._atom_line.chainID)
-    r = property(lambda self: self._r)
     serial = property(lambda self: self._atom_line.serial)
     element = property(lambda self: self._atom_line.element)
     charge = property(lambda self: self._atom_line.charge)
 
     def set_name(self, name):
         assert type(name) == str
-        self._name = name
         self._atom_line = self._atom_line.copy_with_name(name)
 
     def is_hydrogen(self):
@@ -423,7 +1877,80 @@ class PDBAtom(object):
         return str(self._atom_line)
 
     def distance_to(self, atom):
-        return np.linalg.norm(self._r - atom.r)
+        return np.linalg.norm(self.r - atom.r)
+
+
+class PDBTrajectory(object):
+
+    """Frames of coordinates of the atoms of a single topology
+
+    The topology is a PDBAtomTable whose names, residues and chains are 
+    shared by every frame, and the coordinates are one contiguous 
+    (frames, atoms, 3) array, so per-frame analyses work on array slices 
+    instead of building a PDBProtein per frame.
+
+    """
+
+    @classmethod
+    def parse_file(cls, pdb_file, dtype=np.float64):
+        """Return the trajectory of the MODEL/ENDMDL ensemble of a pdb file"""
+        topology = None
+        frames = []
+        for table in iter_pdb_tables(pdb_file):
+            if topology is None:
+                topology = table
+            assert len(table) == len(topology), 'models must have the same atoms'
+            frames.append(table.r.astype(dtype))
+        if topology is None:
+            return PDBTrajectory(PDBAtomTable.empty(), np.empty((0, 0, 3), dtype=dtype))
+        return PDBTrajectory(topology, np.stack(frames))
+
+    @classmethod
+    def for_protein(cls, protein, coordinates):
+        return PDBTrajectory(PDBAtomTable.for_atoms(protein.atoms), coordinates)
+
+    def __init__(self, topology, coordinates):
+        assert(type(topology) == PDBAtomTable)
+        assert(type(coordinates) == np.ndarray)
+        assert(coordinates.ndim == 3 and coordinates.shape[1:] == (len(topology), 3))
+        self._topology = topology
+        self._coordinates = coordinates
+        self._atom_residues, self._residue_starts = topology.residue_indices()
+
+    topology = property(lambda self: self._topology)
+    coordinates = property(lambda self: self._coordinates)
+    atom_residues = property(lambda self: self._atom_residues)
+
+    def __len__(self):
+        return len(self._coordinates)
+
+    def frame(self, f):
+        """Return frame f as a PDBAtomTable sharing the topology columns"""
+        return self._topology.with_coordinates(self._coordinates[f])
+
+    def protein(self, f):
+        return PDBProtein.from_table(self.frame(f))
+
+    def select(self, selection):
+        """Return the trajectory of the atoms in a Selection of the topology; 
+        its coordinates are a view when the atoms are consecutive"""
+        indices = self._topology.indices(selection)
+        return PDBTrajectory(self._topology[indices], self._coordinates[:, indices])
+
+    def distances(self, i, j):
+        """Return the (frames, len(i)) distances between atoms i and j, 
+        index arrays into the topology, in every frame"""
+        return np.linalg.norm(self._coordinates[:, i] - self._coordinates[:, j], axis=-1)
+
+    def residue_contacts(self, d, f, block_size=8192):
+        """Return the residue contacts of frame f as PDBProtein.residue_contacts 
+        does, with residues numbered by their order in the topology"""
+        is_heavy = self._topology.element != 'H'
+        return _residue_contacts(self._coordinates[f][is_heavy], 
+            self._atom_residues[is_heavy], 
+            self._topology.chainID[self._residue_starts], 
+            self._topology.resSeq[self._residue_starts], 
+            d, block_size)
 
 
 def parse_pdb_ATOM_line(atm_line):
@@ -501,24 +2028,364 @@ def print_pdb_ATOM_line(atm_dic):
     return atmLine
 
 
+# the layout of print_pdb_ATOM_line as one format string
+_ATOM_RECORD_FORMAT = '%-6s%5s %-4s%-1s%-4s%-1s%4s%-1s   %8s%8s%8s%6s%6s          %2s%2s'
+_TABLE_RECORD_FORMAT = '%-6s%5s %-4s%-1s%-4s%-1s%4s%-1s   %8.3f%8.3f%8.3f%6s%6s          %2s%2s'
+_TER_RECORD_FORMAT = 'TER   %5s      %-4s%-1s%4s%-1s'
+
+
+def _record_columns(structure):
+    """Return the format of the records of a PDBAtomTable or a list of 
+    PDBAtoms and their fields as lists, in the order of the format"""
+    if type(structure) == PDBAtomTable:
+        return _TABLE_RECORD_FORMAT, [structure.kind.tolist(), 
+            _hybrid36_strings(structure.serial, 5), structure.name.tolist(), 
+            structure.altLoc.tolist(), structure.resName.tolist(), 
+            structure.chainID.tolist(), _hybrid36_strings(structure.resSeq, 4), 
+            structure.iCode.tolist()] + [structure.r[:, i].tolist() for i in range(3)] + \
+            [['' if value != value else '%.2f' % value for value in column.tolist()] 
+                for column in (structure.occupancy, structure.tempFactor)] + \
+            [structure.element.tolist(), structure.charge.tolist()]
+    rows = [atom.atom_line.fields() for atom in structure]
+    return _ATOM_RECORD_FORMAT, [list(column) for column in zip(*rows)] or [[]] * 15
+
+
+def _format_record_batches(structure, ter, batch_size):
+    # only the fields of one batch are held at a time; the rows of a table 
+    # are sliced as views, the atoms of a protein listed once
+    if type(structure) != PDBAtomTable:
+        assert(type(structure) == PDBProtein)
+        structure = structure.atoms
+    count = len(structure)
+    for start in range(0, count, batch_size):
+        stop = min(start + batch_size, count)
+        # with the next record, to find whether the last of the batch ends a chain
+        record_format, columns = _record_columns(structure[start:min(stop + 1, count)])
+        # names shorter than 4 characters start in the second column
+        columns[2] = [name if name[:1] == ' ' or len(name) >= 4 else ' ' + name 
+            for name in columns[2]]
+        rows = list(zip(*columns))
+        records = [record_format % row for row in rows[:stop - start]]
+        if ter:
+            is_atom = np.array(columns[0]) == 'ATOM'
+            chainIDs = np.array(columns[5])
+            ends_chain = np.ones(len(rows), dtype=bool)
+            ends_chain[:-1] = ~is_atom[1:] | (chainIDs[1:] != chainIDs[:-1])
+            ters = np.flatnonzero(is_atom[:stop - start] & ends_chain[:stop - start])
+            # insert from the back so the positions of earlier records hold
+            for i in reversed(ters.tolist()):
+                row = rows[i]
+                # serials are written as they are, so a TER numbered after its 
+                # chain would repeat the serial of the next record
+                records.insert(i + 1, 
+                    _TER_RECORD_FORMAT % ('', row[4], row[5], row[6], row[7]))
+        yield records
+
+
+def format_pdb_records(structure, ter=False):
+
+    """Yield the ATOM/HETATM records of a PDBAtomTable or PDBProtein
+
+    Arguments:
+
+    structure: PDBAtomTable or PDBProtein
+    ter: if True, a TER record, without a serial, follows the last ATOM of 
+    each chain
+
+    Records are laid out as print_pdb_ATOM_line does, formatting all fields 
+    of a record at once instead of padding them one by one.
+
+    """
+    for records in _format_record_batches(structure, ter, 4096):
+        yield from records
+
+
+def write_pdb(pdb_file, models, ter=True, batch_size=4096):
+
+    """Write structures to a pdb file in batches of records
+
+    Arguments:
+
+    pdb_file: path or open text file to write to
+    models: a PDBAtomTable, PDBProtein or PDBTrajectory, or a list of 
+    tables/proteins. Several models (or the frames of a trajectory) are 
+    written between MODEL and ENDMDL records
+    ter: if True, a TER record, without a serial, follows the last ATOM of 
+    each chain
+    batch_size: number of atom records joined per write
+
+    """
+    assert(batch_size > 0)
+    if isinstance(pdb_file, (str, os.PathLike)):
+        with open(pdb_file, 'w', buffering=1 << 20) as f:
+            return write_pdb(f, models, ter, batch_size)
+
+    if type(models) == PDBTrajectory:
+        models = [models.frame(f) for f in range(len(models))]
+    is_ensemble = type(models) not in (PDBAtomTable, PDBProtein)
+    if not is_ensemble:
+        models = [models]
+    for model_number, model in enumerate(models, 1):
+        if is_ensemble:
+            pdb_file.write(f'MODEL     {model_number:4d}\n')
+        for records in _format_record_batches(model, ter, batch_size):
+            pdb_file.write('\n'.join(records) + '\n')
+        if is_ensemble:
+            pdb_file.write('ENDMDL\n')
+    pdb_file.write('END\n')
+
+
+RCSB_STRUCTURE_URL = 'https://www.rcsb.org/structure/'
+RCSB_ENTRY_URL = 'https://data.rcsb.org/rest/v1/core/entry/'
+
+
+def _resolution_from_page(pagecontents):
+    """Return the resolution in an rcsb.org structure page, 'N/F' if the 
+    page has none"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(pagecontents, features="lxml")
+    tags = soup.find_all(id=re.compile('exp_header_.*_resolution'))
+    resolution = (re.findall('\d+\.\d+', str(tags[0])) if len(tags) else ['N/F'])[0]
+    if not len(resolution):
+        resolution = 'N/A'
+    return resolution
+
+
+_resolution_start_tag = re.compile(
+    rb'<(\w+)[^>]*?\sid=["\']?exp_header_[^"\'\s>]*_resolution\b[^>]*>')
+_tag = re.compile(rb'<[^>]*>')
+_decimal = re.compile(rb'\d+\.\d+')
+
+
+def _resolution_from_chunks(chunks):
+    """Return the resolution in an rcsb.org structure page read as chunks of 
+    bytes, 'N/F' if the page has none
+
+    The page is scanned as it arrives and no more chunks are taken once the 
+    element holding the resolution is closed. Only the text from the last 
+    '<' (or from the start of that element) is kept between chunks. An 
+    element left unclosed by the end of the page is handed to the 
+    BeautifulSoup parser.
+
+    """
+    buffer = bytearray()
+    start = None
+    for chunk in chunks:
+        buffer += chunk
+        if start is None:
+            start = _resolution_start_tag.search(buffer)
+            if start is None:
+                partial = buffer.rfind(b'<')
+                del buffer[:partial if partial >= 0 else len(buffer)]
+                continue
+            del buffer[:start.start()]
+            start = _resolution_start_tag.match(buffer)
+        end = buffer.find(b'</' + start.group(1), start.end())
+        if end >= 0:
+            resolution = _decimal.search(_tag.sub(b' ', buffer[start.end():end]))
+            return resolution.group().decode() if resolution else 'N/A'
+    if start is None:
+        return 'N/F'
+    return _resolution_from_page(buffer.decode('utf-8', 'replace'))
+
+
+def _resolution_from_entry(entry):
+    """Return the resolution in an entry of the RCSB data api, 'N/F' if the 
+    entry has none"""
+    resolutions = entry.get('rcsb_entry_info', {}).get('resolution_combined') or []
+    return f'{resolutions[0]:.2f}' if resolutions else 'N/F'
+
+
 def get_pdb_resolution_from_web(pdbid):
-    url = f'https://www.rcsb.org/structure/{pdbid.upper()}'
+    url = f'{RCSB_STRUCTURE_URL}{pdbid.upper()}'
     try:
         pdbWebPage_f = urlrequest.urlopen(url)
-        pagecontents = pdbWebPage_f.read().decode('utf-8')
     except urlerror:
         print('error')
         resolution = 'N/F'
         return resolution
-    soup = BeautifulSoup(pagecontents, features="lxml")
-    tags = soup.find_all(id=re.compile('exp_header_.*_resolution'))
-    resolution = (re.findall('\d+\.\d+', str(tags[0])) if len(tags) else ['N/F'])[0]
-    if not len(resolution):
-        resolution = 'N/A'
-    return resolution
+    with pdbWebPage_f:
+        return _resolution_from_chunks(iter(lambda: pdbWebPage_f.read(16384), b''))
+
+
+class _ThreadSessions(object):
+
+    """requests sessions of the threads of one pool, one per thread so each 
+    worker reuses its connections, closed together when the pool is done"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            with self._lock:
+                self._sessions.append(self._local.session)
+        return self._local.session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions = []
+
+
+def _retry_after(response):
+    """Return the seconds the Retry-After header of response asks to wait, 
+    given as seconds or as a date; None without a valid one"""
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.)
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return max((date - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.)
+
+
+def _fetch_resolution(session, pdbid, base_url, timeout, retries, backoff):
+    """Return the resolution of pdbid, retrying failed requests, server 
+    errors and rate limits (429) with exponential backoff, or after the 
+    Retry-After of the response when it gives one. Unknown ids and requests 
+    that keep failing give 'N/F'"""
+    wait = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1) if wait is None else wait)
+        wait = None
+        try:
+            with session.get(f'{base_url}{pdbid}', timeout=timeout, 
+                stream=True) as response:
+                if response.status_code == 429 or response.status_code >= 500:
+                    wait = _retry_after(response)
+                    continue
+                if not response.ok:
+                    return 'N/F'
+                if response.headers.get('Content-Type', '').startswith('application/json'):
+                    return _resolution_from_entry(response.json())
+                chunks = response.iter_content(16384)
+                resolution = _resolution_from_chunks(chunks)
+                # drain the rest unparsed so the connection goes back to the pool
+                for _ in chunks:
+                    pass
+                return resolution
+        except requests.RequestException:
+            continue
+    return 'N/F'
+
+
+def fetch_pdb_resolutions(pdbids, concurrency=8, timeout=10, retries=3, backoff=0.5, 
+    base_url=RCSB_STRUCTURE_URL, db_path="~/Proteins/misc/pdb_rsln.dat"):
+
+    """Fetch the resolutions of pdbids from rcsb.org concurrently and return 
+    them as a dict
 
+    Arguments:
+
+    pdbids: pdbids to fetch
+    concurrency: number of requests in flight at a time
+    timeout: seconds to wait for each request
+    retries: times a request failing to connect, with a server error or 
+    rate limited (429) is retried, waiting backoff, 2 * backoff, 
+    4 * backoff... seconds between, or what the Retry-After of the response 
+    asks
+    base_url: url the upper-case pdbid is appended to; RCSB_ENTRY_URL 
+    fetches the json entries of the RCSB data api instead of the pages
+    db_path: resolution store the results are appended to; None to skip
+
+    """
+    assert(concurrency > 0)
+    pdbids = list(dict.fromkeys(pdbid.upper()[:4] for pdbid in pdbids))
+    sessions = _ThreadSessions()
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            resolutions = pool.map(lambda pdbid: _format_resolution(_fetch_resolution(
+                sessions.get(), pdbid, base_url, timeout, retries, backoff)), pdbids)
+            resolutions = dict(zip(pdbids, resolutions))
+    finally:
+        sessions.close()
+    if db_path is not None and resolutions:
+        resolution_store(db_path).add(resolutions)
+    return resolutions
+
+
+class ResolutionStore(object):
+
+    """Resolutions of pdbids kept in a text file of 'PDBID resolution' lines
+
+    The file is read once into a dict; later calls only read lines appended 
+    since (by this or another process), so a lookup is a dict access.
+    When a pdbid appears more than once its last line wins.
+
+    """
+
+    def __init__(self, db_path):
+        self._db_path = db_path
+        self._resolutions = {}
+        self._read_bytes = 0
+
+    db_path = property(lambda self: self._db_path)
+
+    def refresh(self):
+        try:
+            with open(self._db_path, 'rb') as f:
+                f.seek(self._read_bytes)
+                appended = f.read()
+        except IOError:
+            return
+        # only whole lines are taken, a partial last line is read next time
+        appended = appended[:appended.rfind(b'\n') + 1]
+        self._read_bytes += len(appended)
+        for line in appended.decode().splitlines():
+            line_parts = line.split()
+            if len(line_parts) > 1:
+                self._resolutions[line_parts[0]] = line_parts[1]
+
+    def get(self, pdbid):
+        self.refresh()
+        return self._resolutions.get(pdbid)
+
+    def get_many(self, pdbids):
+        self.refresh()
+        return [self._resolutions.get(pdbid) for pdbid in pdbids]
+
+    def add(self, resolutions):
+        """Append a dict of pdbid: resolution to the file"""
+        self.refresh()
+        (db_dir, db_file) = os.path.split(self._db_path)
+        os.makedirs(db_dir, exist_ok=True)
+        with open(self._db_path, 'a') as f:
+            f.write(''.join('%s %s\n' % item for item in resolutions.items()))
+        self.refresh()
 
-def pdb_rsln(pdbid):
+
+_resolution_stores = {}
+
+
+def resolution_store(db_path="~/Proteins/misc/pdb_rsln.dat"):
+    """Return the ResolutionStore of db_path, one per path per process"""
+    db_path = os.path.expanduser(db_path)
+    if db_path not in _resolution_stores:
+        _resolution_stores[db_path] = ResolutionStore(db_path)
+    return _resolution_stores[db_path]
+
+
+def _format_resolution(resolution):
+    try:
+        return '%.2f' % float(resolution)
+    except ValueError:
+        return resolution
+
+
+def pdb_rsln(pdbid, db_path="~/Proteins/misc/pdb_rsln.dat"):
     
     """Return resolution of pdbid
 
@@ -530,25 +2397,29 @@ def pdb_rsln(pdbid):
 
     assert len(pdbid) > 3
     pdbid = pdbid.upper()[:4]
-    db_path = os.path.expanduser("~/Proteins/misc/pdb_rsln.dat")
-    (db_dir, db_file) = os.path.split(db_path)
-    os.makedirs(db_dir, exist_ok=True)
-
-    try:
-        with open(db_path, 'r') as f:
-            pdbids = array([])
-            rslns = array([])
-            for line in f:
-                line_parts = line.split()
-                pdbids = append(pdbids, line_parts[0])
-                rslns = append(rslns, line_parts[1])
-            if pdbid in pdbids:
-                rsln = rslns[pdbids == pdbid][0]
-                if rsln not in ['N/A', 'N/F']:
-                    return rsln
-    except IOError:
-        pass
-    rsln = '%.2f' % float(get_pdb_resolution_from_web(pdbid))
-    with open(db_path, 'a') as f:
-        f.write('%s %s\n' % (pdbid, rsln))
+    store = resolution_store(db_path)
+    rsln = store.get(pdbid)
+    if rsln not in [None, 'N/A', 'N/F']:
+        return rsln
+    rsln = _format_resolution(get_pdb_resolution_from_web(pdbid))
+    store.add({pdbid: rsln})
     return rsln
+
+
+def pdb_rsln_many(pdbids, db_path="~/Proteins/misc/pdb_rsln.dat", **fetch_options):
+
+    """Return the resolutions of pdbids as a list, in the same order
+
+    Cached resolutions are looked up in one pass over the store; the 
+    others are fetched concurrently by fetch_pdb_resolutions, which takes 
+    fetch_options, and appended to the store together.
+
+    """
+    assert all(len(pdbid) > 3 for pdbid in pdbids)
+    pdbids = [pdbid.upper()[:4] for pdbid in pdbids]
+    store = resolution_store(db_path)
+    resolutions = dict(zip(pdbids, store.get_many(pdbids)))
+    missing = [pdbid for pdbid, rsln in resolutions.items() if rsln in [None, 'N/A', 'N/F']]
+    if missing:
+        resolutions.update(fetch_pdb_resolutions(missing, db_path=db_path, **fetch_options))
+    return [resolutions[pdbid] for pdbid in pdbids]
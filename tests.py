@@ -2,8 +2,21 @@ import unittest
 import sure
 from .funcs import *
 from .pdb import *
+from .pdb import _resolution_from_chunks, _resolution_from_page, _line_bounds, _KEPT_SELECTIONS
+from . import constants
+from .constants import Receptor, load_receptors, AminoAcid, amino_acid_codes, \
+    amino_acid_letters_of, amino_acid_groups_of, amino_acid_abbrs, UNKNOWN_AMINO_ACID
+import requests
+import json
+import numpy as np
 from numpy.testing import assert_array_equal
-from io import StringIO
+from io import StringIO, BytesIO
+import os
+import shutil
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
  
 
 
@@ -79,6 +92,598 @@ class ProteinDataBankAtomParser(unittest.TestCase):
 
 
 
+PDB_TEXT = """HEADER    TEST
+ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00  0.00           N
+ATOM      2  CA  ALA A   1      11.639   6.071  -5.147  1.00  0.00           C
+ATOM      3  H   ALA A   1      10.500   6.800  -6.900  1.00  0.00           H
+ATOM      4  N   GLY A   2      13.149   6.067  -5.124  1.00  0.00           N
+HETATM    5  O   HOH B 101      20.000  20.000  20.000  0.50 35.88           O-1
+END
+"""
+
+
+
+class TestPDBAtomTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = PDBAtomTable.parse_string(PDB_TEXT)
+
+    def test_should_read_only_atom_records(self):
+        len(self.table).should.equal(5)
+        assert_array_equal(self.table.kind, 
+            ['ATOM', 'ATOM', 'ATOM', 'ATOM', 'HETATM'])
+
+    def test_should_give_columns_as_arrays(self):
+        assert_array_equal(self.table.serial, [1, 2, 3, 4, 5])
+        assert_array_equal(self.table.resSeq, [1, 1, 1, 2, 101])
+        assert_array_equal(self.table.name, ['N', 'CA', 'H', 'N', 'O'])
+        assert_array_equal(self.table.chainID, ['A', 'A', 'A', 'A', 'B'])
+        assert_array_equal(self.table.r[1], [11.639, 6.071, -5.147])
+        self.table.r.shape.should.equal((5, 3))
+        self.table.occupancy[4].should.equal(0.5)
+        self.table.charge[4].should.equal('-1')
+
+    def test_should_agree_with_the_line_parser(self):
+        lines = [PDBAtomLine.parse_string(line) for line in PDB_TEXT.splitlines()]
+        expected = [str(line) for line in lines if line]
+        [str(self.table.atom_line(i)) for i in range(5)].should.equal(expected)
+
+    def test_should_read_hybrid_36_and_overflowing_numbers(self):
+        lines = [str(PDBAtomLine(serial, 'CA', '', 'ALA', 'A', resSeq, '', '1.000', '2.000', 
+            '3.000', '1.00', '0.00', 'C', '')) for serial, resSeq in 
+            [('99999', '9999'), ('A0000', 'A000'), ('a0000', 'a000'), ('*****', '****')]]
+        table = PDBAtomTable.parse_string('\n'.join(lines))
+        assert_array_equal(table.serial, [99999, 100000, 43770016, 0])
+        assert_array_equal(table.resSeq, [9999, 10000, 1223056, 0])
+        [str(line) for line in table.atom_lines()[:3]].should.equal(lines[:3])
+
+    def test_should_store_strings_as_categories(self):
+        assert_array_equal(self.table.categories('name'), ['CA', 'H', 'N', 'O'])
+        assert_array_equal(self.table.codes('name'), [2, 0, 1, 2, 3])
+        self.table.codes('name').dtype.should.equal(np.uint8)
+
+    def test_should_select_rows(self):
+        assert_array_equal(self.table[self.table.element != 'H'].serial, 
+            [1, 2, 4, 5])
+
+    def test_protein_should_be_built_from_table(self):
+        protein = PDBProtein.from_table(self.table)
+        [residue.resSeq for residue in protein.residues].should.equal(
+            ['1', '2', '101'])
+        assert_array_equal(protein.residues_dict['1'].atoms[1].r, 
+            [11.639, 6.071, -5.147])
+
+
+MULTI_MODEL_PDB_TEXT = """MODEL        1
+ATOM      1  N   ALA A   1      11.104   6.134  -6.504  1.00  0.00           N
+ATOM      2  CA  ALA A   1      11.639   6.071  -5.147  1.00  0.00           C
+ENDMDL
+MODEL        2
+ATOM      1  N   ALA A   1      12.104   6.134  -6.504  1.00  0.00           N
+ATOM      2  CA  ALA A   1      12.639   6.071  -5.147  1.00  0.00           C
+ENDMDL
+END
+"""
+
+
+
+class TestPDBStreaming(unittest.TestCase):
+
+    def test_should_yield_a_table_per_model(self):
+        tables = list(iter_pdb_tables(StringIO(MULTI_MODEL_PDB_TEXT)))
+        len(tables).should.equal(2)
+        assert_array_equal(tables[1].r[:, 0], [12.104, 12.639])
+
+    def test_should_split_models_into_chunks(self):
+        tables = list(iter_pdb_tables(StringIO(PDB_TEXT), chunk_size=2))
+        [len(table) for table in tables].should.equal([2, 2, 1])
+
+    def test_should_yield_proteins(self):
+        proteins = list(iter_pdb_models(StringIO(MULTI_MODEL_PDB_TEXT)))
+        len(proteins).should.equal(2)
+        proteins[0].residues[0].atoms[0].r[0].should.equal(11.104)
+
+
+class TestMappedPDBFile(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.pdb')
+        with os.fdopen(handle, 'w') as f:
+            f.write('HELIX   1   1A ARG A 1125T ALA B 1134W ' + \
+                '2THIS_IS_A_COMMENT_LIKE_IT_HUH?   10    \n')
+            f.write(MULTI_MODEL_PDB_TEXT.replace('ALA A   1', 'ALA B   1', 1))
+        self.pdb_file = MappedPDBFile(self.path)
+
+    def tearDown(self):
+        self.pdb_file.close()
+        os.remove(self.path)
+
+    def test_should_find_lines_across_scan_windows(self):
+        data = b'\n\nATOM 1\r\nHETATM 2\n\nMODEL 3\nEND'
+        for window_size in (1, 3, 7, len(data)):
+            lines = [data[start:end] for starts, ends in _line_bounds(
+                np.frombuffer(data, dtype=np.uint8), window_size) 
+                for start, end in zip(starts.tolist(), ends.tolist())]
+            lines.should.equal([b'ATOM 1', b'HETATM 2', b'MODEL 3', b'END'])
+
+    def test_should_index_records(self):
+        len(self.pdb_file).should.equal(4)
+        self.pdb_file.model_count.should.equal(2)
+        self.pdb_file.helix_lines()[0].endSeqNum.should.equal('1134')
+
+    def test_should_select_by_chain_and_model(self):
+        assert_array_equal(self.pdb_file.atom_indices(chainID='A'), [1, 2, 3])
+        assert_array_equal(self.pdb_file.atom_indices(model=1), [2, 3])
+
+    def test_should_decode_fields_on_first_access(self):
+        record = bytearray(MULTI_MODEL_PDB_TEXT.splitlines()[2].encode())
+        line = LazyPDBAtomLine(record, 0, len(record))
+        line.name.should.equal('CA')
+        record[12:16] = b' CB '
+        record[30:38] = b'   0.000'
+        line.name.should.equal('CA')
+        line.x.should.equal('0.000')
+
+    def test_lazy_lines_should_match_parsed_lines(self):
+        str(self.pdb_file.atom_line(1)).should.equal(str(PDBAtomLine.parse_string(
+            MULTI_MODEL_PDB_TEXT.splitlines()[2])))
+
+    def test_should_build_proteins(self):
+        protein = self.pdb_file.protein(chainID='A', model=1)
+        atoms = protein.residues[0].atoms
+        [atom.serial for atom in atoms].should.equal(['1', '2'])
+        atoms[0].r[0].should.equal(12.104)
+
+
+class TestCellList(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.default_rng(7)
+        self.points = random.uniform(0, 30, (400, 3))
+        self.queries = random.uniform(-5, 35, (50, 3))
+
+    def brute_force_pairs(self, d):
+        distances = np.linalg.norm(self.queries[:, np.newaxis] - self.points, axis=-1)
+        return set(zip(*np.nonzero(distances < d)))
+
+    def test_should_find_the_same_pairs_as_brute_force(self):
+        for d in (0.5, 3.0, 4.0, 9.5):
+            i, j = CellList(self.points).pairs_within(d, self.queries)
+            set(zip(i, j)).should.equal(self.brute_force_pairs(d))
+
+    def test_should_tell_whether_any_point_is_within(self):
+        cells = CellList(self.points)
+        cells.any_within(1e-9, self.queries).should.be.false
+        cells.any_within(1e-9, self.points[3]).should.be.true
+
+
+
+class TestPDBProximity(unittest.TestCase):
+
+    def setUp(self):
+        self.protein = PDBProtein.from_table(PDBAtomTable.parse_string(PDB_TEXT))
+        self.water = self.protein.residues_dict['101']
+        self.alanine = self.protein.residues_dict['1']
+
+    def test_residue_should_skip_hydrogens(self):
+        # the hydrogen of ALA 1 is 0.87 from O, the closest heavy atom 1.83
+        probe = PDBResidue([PDBAtom(PDBAtomLine.parse_string(
+            'ATOM      9  O   HOH C   9      10.000   7.500  -7.000  1.00  0.00           O'))])
+        self.alanine.is_closer_than(1.0, probe).should.be.false
+        self.alanine.is_closer_than(2.0, probe).should.be.true
+
+    def test_protein_should_agree_with_residues(self):
+        for d in (1.0, 2.0, 25.0):
+            self.protein.is_closer_than(d, self.alanine).should.equal(
+                any(residue.is_closer_than(d, self.alanine) 
+                    for residue in self.protein.residues))
+
+    def test_protein_should_find_close_residues_and_atoms(self):
+        [residue.resSeq for residue in 
+            self.protein.residues_closer_than(2.0, self.alanine)].should.equal(
+            ['1', '2'])
+        [atom.serial for atom in 
+            self.protein.atoms_closer_than(0.1, self.water)].should.equal(['5'])
+
+
+class TestResidueContacts(unittest.TestCase):
+
+    def setUp(self):
+        self.protein = PDBProtein.from_table(PDBAtomTable.parse_string(PDB_TEXT))
+
+    def test_should_find_pairs_with_minimum_distances(self):
+        contacts = self.protein.residue_contacts(2.0)
+        len(contacts).should.equal(1)
+        contacts['resSeq1'][0].should.equal(1)
+        contacts['resSeq2'][0].should.equal(2)
+        contacts['chainID2'][0].should.equal('A')
+        # the closest heavy atoms of ALA 1 and GLY 2 are CA 2 and N 4
+        contacts['distance'][0].should.equal(np.linalg.norm(
+            np.array([11.639, 6.071, -5.147]) - [13.149, 6.067, -5.124]))
+
+    def test_should_agree_with_pairwise_residue_checks(self):
+        residues = self.protein.residues
+        for d, block_size in ((2.0, 1), (30.0, 2), (30.0, 100)):
+            contacts = self.protein.residue_contacts(d, block_size=block_size)
+            set(zip(contacts['residue1'], contacts['residue2'])).should.equal(
+                {(i, j) for i in range(len(residues)) 
+                    for j in range(i + 1, len(residues)) 
+                    if residues[i].is_closer_than(d, residues[j])})
+
+
+    def test_should_keep_residues_of_different_chains_apart(self):
+        lines = [PDBAtomLine.parse_string(line) for line in PDB_TEXT.splitlines()][1:5]
+        chain_b = [line.copy_with(chainID='B', y=f'{float(line.y) + 1.5:.3f}') 
+            for line in lines if line.name != 'H']
+        contacts = PDBProtein(lines + chain_b).residue_contacts(2.0)
+        {(c['chainID1'], int(c['resSeq1']), c['chainID2'], int(c['resSeq2'])) 
+            for c in contacts}.should.equal({('A', 1, 'A', 2), ('A', 1, 'B', 1), 
+                ('A', 2, 'B', 2), ('B', 1, 'B', 2)})
+
+
+class TestPDBTrajectory(unittest.TestCase):
+
+    def setUp(self):
+        self.trajectory = PDBTrajectory.parse_file(StringIO(MULTI_MODEL_PDB_TEXT))
+
+    def test_should_stack_models_into_frames(self):
+        self.trajectory.coordinates.shape.should.equal((2, 2, 3))
+        len(self.trajectory).should.equal(2)
+        assert_array_equal(self.trajectory.topology.name, ['N', 'CA'])
+
+    def test_should_store_single_precision_frames(self):
+        PDBTrajectory.parse_file(StringIO(MULTI_MODEL_PDB_TEXT), 
+            dtype=np.float32).coordinates.dtype.should.equal(np.float32)
+
+    def test_frames_should_share_the_topology(self):
+        frame = self.trajectory.frame(1)
+        frame.codes('name').should.be(self.trajectory.topology.codes('name'))
+        assert_array_equal(frame.r[:, 0], [12.104, 12.639])
+        str(self.trajectory.protein(1).residues[0].atoms[0]).should.contain('12.104')
+
+    def test_should_measure_distances_over_frames(self):
+        distances = self.trajectory.distances(np.array([0]), np.array([1]))
+        distances.shape.should.equal((2, 1))
+        distances[0, 0].should.equal(distances[1, 0])
+
+    def test_should_find_contacts_per_frame(self):
+        protein = PDBProtein.from_table(PDBAtomTable.parse_string(PDB_TEXT))
+        coordinates = np.array([atom.r for atom in protein.atoms])
+        trajectory = PDBTrajectory.for_protein(protein, 
+            np.stack([coordinates, coordinates * 10]))
+        len(trajectory.residue_contacts(2.0, 0)).should.equal(1)
+        len(trajectory.residue_contacts(2.0, 1)).should.equal(0)
+
+
+class TestPDBForces(unittest.TestCase):
+
+    def setUp(self):
+        lines = [PDBAtomLine.parse_string(line) for line in PDB_TEXT.splitlines()]
+        self.lines = [line for line in lines if line]
+        self.forces = np.arange(15, dtype=np.float64).reshape(5, 3)
+        self.protein = PDBProtein(self.lines, forces=self.forces)
+
+    def test_should_sum_forces_by_residue(self):
+        assert_array_equal(self.protein.residue_forces(), 
+            [[9., 12., 15.], [9., 10., 11.], [12., 13., 14.]])
+        assert_array_equal(self.protein.residues[0].force, [9., 12., 15.])
+
+    def test_should_align_forces_with_atoms_grouped_by_residue(self):
+        # GLY 2 comes between the atoms of ALA 1
+        protein = PDBProtein([self.lines[0], self.lines[3], self.lines[1]], 
+            forces=self.forces[:3])
+        assert_array_equal(protein.forces, self.forces[[0, 2, 1]])
+        assert_array_equal(protein.atoms[1].force, [6., 7., 8.])
+
+    def test_should_sum_forces_by_chain(self):
+        chainIDs, forces = self.protein.chain_forces()
+        assert_array_equal(chainIDs, ['A', 'B'])
+        assert_array_equal(forces, [[18., 22., 26.], [12., 13., 14.]])
+
+    def test_should_sum_forces_of_chains_sharing_resSeqs(self):
+        lines = self.lines[:4] + [line.copy_with(chainID='B') for line in self.lines[:4]]
+        protein = PDBProtein(lines, forces=np.ones((8, 3)))
+        chainIDs, forces = protein.chain_forces()
+        assert_array_equal(chainIDs, ['A', 'B'])
+        assert_array_equal(forces, [[4., 4., 4.], [4., 4., 4.]])
+
+    def test_should_refresh_sums_when_forces_change(self):
+        self.protein.residue_forces()
+        self.protein.set_forces(np.ones((5, 3)))
+        assert_array_equal(self.protein.residue_forces()[:, 0], [3., 1., 1.])
+
+    def test_should_sum_forces_set_on_atoms(self):
+        self.protein.residue_forces()
+        self.protein.atoms[0].force = np.array([100., 0., 0.])
+        assert_array_equal(self.protein.residues[0].force, [109., 11., 13.])
+        assert_array_equal(self.protein.residue_forces()[0], [109., 11., 13.])
+        assert_array_equal(self.protein.forces[0], [100., 0., 0.])
+        self.protein.residues[0].reorder_by_names(['H', 'CA', 'N'])
+        self.protein.atoms[2].set_force(np.zeros(3))
+        assert_array_equal(self.protein.residue_forces()[0], [9., 11., 13.])
+
+    def test_should_keep_forces_aligned_when_stripping_hydrogens(self):
+        self.protein.strip_hydrogens()
+        assert_array_equal(self.protein.residue_forces()[0], [3., 5., 7.])
+
+    def test_should_sum_many_frames_at_once(self):
+        frames = np.stack([self.forces, 2 * self.forces])
+        self.protein.sum_by_residue(frames).shape.should.equal((2, 3, 3))
+        assert_array_equal(self.protein.sum_by_residue(frames)[1], 
+            2 * self.protein.residue_forces())
+
+    def test_protein_from_table_should_take_forces(self):
+        protein = PDBProtein.from_table(PDBAtomTable.parse_string(PDB_TEXT), 
+            forces=self.forces)
+        assert_array_equal(protein.residue_forces(), self.protein.residue_forces())
+
+
+class TestBulkEdits(unittest.TestCase):
+
+    def setUp(self):
+        self.table = PDBAtomTable.parse_string(PDB_TEXT)
+        self.protein = PDBProtein.from_table(self.table)
+
+    def test_protein_should_renumber_serials(self):
+        old, new = self.protein.renumber_serials(first=10)
+        assert_array_equal(old, [1, 2, 3, 4, 5])
+        assert_array_equal(new, [10, 11, 12, 13, 14])
+        [atom.serial for atom in self.protein.atoms].should.equal(
+            ['10', '11', '12', '13', '14'])
+
+    def test_protein_should_renumber_residues(self):
+        old, new = self.protein.renumber_residues()
+        assert_array_equal(old, [1, 2, 101])
+        list(self.protein.residues_dict.keys()).should.equal(['1', '2', '3'])
+        self.protein.residues_dict['3'].atoms[0].resSeq.should.equal('3')
+
+    def test_protein_should_rename_atoms_and_chains(self):
+        self.protein.rename_atoms({'N': 'N1', 'CA': 'CA', 'H': 'H1', 'O': 'OW'})
+        self.protein.reassign_chains({'B': 'W'})
+        [atom.name for atom in self.protein.atoms].should.equal(
+            ['N1', 'CA', 'H1', 'N1', 'OW'])
+        [atom.chainID for atom in self.protein.atoms].should.equal(
+            ['A', 'A', 'A', 'A', 'W'])
+        str(self.protein).splitlines()[4].should.contain(' OW  HOH W 101')
+
+    def test_protein_edits_should_leave_the_given_lines_alone(self):
+        lines = self.table.atom_lines()
+        protein = PDBProtein(lines)
+        other = PDBProtein(lines)
+        protein.rename_atoms({'N': 'N1', 'CA': 'CA', 'H': 'H1', 'O': 'OW'})
+        protein.reassign_chains({'B': 'W'})
+        protein.residues[0].rename_atoms({'N1': 'N2', 'CA': 'CA', 'H1': 'H1'})
+        [atom.name for atom in protein.atoms].should.equal(['N2', 'CA', 'H1', 'N1', 'OW'])
+        [line.name for line in lines].should.equal(['N', 'CA', 'H', 'N', 'O'])
+        [atom.chainID for atom in other.atoms].should.equal(['A', 'A', 'A', 'A', 'B'])
+
+    def test_protein_rename_should_need_every_name(self):
+        self.protein.rename_atoms.when.called_with({'N': 'N1'}).should.throw(KeyError)
+
+    def test_table_should_renumber_in_place(self):
+        self.table.renumber_serials(first=0)
+        assert_array_equal(self.table.serial, [0, 1, 2, 3, 4])
+        old, new = self.table.renumber_residues(first=5)
+        assert_array_equal(old, [1, 1, 1, 2, 101])
+        assert_array_equal(self.table.resSeq, [5, 5, 5, 6, 7])
+
+    def test_table_should_rename_categories(self):
+        self.table.rename_atoms({'N': 'CA', 'CA': 'CA', 'H': 'H1', 'O': 'O'})
+        self.table.reassign_chains({'A': 'B'})
+        assert_array_equal(self.table.name, ['CA', 'CA', 'H1', 'CA', 'O'])
+        assert_array_equal(self.table.categories('name'), ['CA', 'H1', 'O'])
+        assert_array_equal(self.table.categories('chainID'), ['B'])
+
+
+class TestLoadPDBFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.paths = []
+        for i, text in enumerate((PDB_TEXT, MULTI_MODEL_PDB_TEXT)):
+            self.paths.append(os.path.join(self.directory, f'{i}.pdb'))
+            with open(self.paths[-1], 'w') as f:
+                f.write(text)
+        self.paths.insert(1, os.path.join(self.directory, 'missing.pdb'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_keep_order_and_capture_errors(self):
+        for processes in (1, 2):
+            results = load_pdb_files(self.paths, processes=processes, as_tables=True)
+            [result.ok for result in results].should.equal([True, False, True])
+            [len(results[i].structure) for i in (0, 2)].should.equal([5, 4])
+            results[1].error.should.be.a(FileNotFoundError)
+            results[1].path.should.equal(self.paths[1])
+
+    def test_should_build_proteins_and_report_progress(self):
+        calls = []
+        results = load_pdb_files(self.paths, processes=2, 
+            progress=lambda done, total, path: calls.append((done, total)))
+        results[0].structure.should.be.a(PDBProtein)
+        str(results[2].structure).should.equal(
+            str(PDBProtein.from_table(PDBAtomTable.parse_file(self.paths[2]))))
+        sorted(calls).should.equal([(1, 3), (2, 3), (3, 3)])
+
+    def test_should_load_chain_sequences(self):
+        results = load_pdb_sequences(self.paths, processes=2)
+        [result.ok for result in results].should.equal([True, False, True])
+        {chainID: sequence.tobytes() for chainID, sequence in 
+            results[0].structure.items()}.should.equal({'A': b'AG'})
+
+
+GAPPED_PDB_TEXT = """ATOM      1  N   MET A   1      11.104   6.134  -6.504  1.00  0.00           N
+ATOM      2  N   SER B   1      11.104   6.134  -6.504  1.00  0.00           N
+ATOM      3  N   LYS A   4      11.104   6.134  -6.504  1.00  0.00           N
+ATOM      4  N   ASP A   4A     11.104   6.134  -6.504  1.00  0.00           N
+ATOM      5  N   UNK A   5      11.104   6.134  -6.504  1.00  0.00           N
+HETATM    6  N   MSE A   6      11.104   6.134  -6.504  1.00  0.00           N
+HETATM    7  N   GLY A   7      11.104   6.134  -6.504  1.00  0.00           N
+ATOM      8  N   TRP B   2      11.104   6.134  -6.504  1.00  0.00           N
+HETATM    9  O   HOH B 101      20.000  20.000  20.000  0.50 35.88           O
+"""
+
+
+class TestChainSequences(unittest.TestCase):
+
+    def setUp(self):
+        self.table = PDBAtomTable.parse_string(GAPPED_PDB_TEXT)
+        self.protein = PDBProtein.from_table(self.table)
+
+    def test_should_give_uint8_sequences_with_gaps(self):
+        for structure in (self.table, self.protein):
+            sequences = structure.chain_sequences()
+            list(sequences).should.equal(['A', 'B'])
+            sequences['A'].dtype.should.equal(np.uint8)
+            {chainID: sequence.tobytes() for chainID, sequence in sequences.items()}.should.equal(
+                {'A': b'M--KDX-G', 'B': b'SW'})
+
+    def test_should_leave_gaps_out_on_request(self):
+        self.protein.chain_sequence_strings(gaps=False).should.equal({'A': 'MKDXG', 'B': 'SW'})
+
+    def test_should_give_residues_in_file_order_when_chains_share_resSeqs(self):
+        table = PDBAtomTable.parse_string(
+            "ATOM      1  N   MET A   2      11.104   6.134  -6.504  1.00  0.00           N\n"
+            "ATOM      2  N   LYS B   1      11.104   6.134  -6.504  1.00  0.00           N\n"
+            "ATOM      3  N   GLY B   2      11.104   6.134  -6.504  1.00  0.00           N\n")
+        protein = PDBProtein.from_table(table)
+        protein.chain_sequence_strings().should.equal({'A': 'M', 'B': 'KG'})
+        {chainID: sequence.tobytes() for chainID, sequence in protein.chain_sequences().items()}.should.equal(
+            {chainID: sequence.tobytes() for chainID, sequence in table.chain_sequences().items()})
+
+    def test_should_keep_the_file_order_after_renumbering_serials(self):
+        protein = PDBProtein.from_table(PDBAtomTable.parse_string(
+            "ATOM      1  N   MET A   5      11.104   6.134  -6.504  1.00  0.00           N\n"
+            "ATOM      2  N   SER B   1      11.104   6.134  -6.504  1.00  0.00           N\n"
+            "ATOM      3  N   LYS B   5      11.104   6.134  -6.504  1.00  0.00           N\n"))
+        protein.chain_sequence_strings(gaps=False).should.equal({'A': 'M', 'B': 'SK'})
+        protein.renumber_serials()
+        protein.chain_sequence_strings(gaps=False).should.equal({'A': 'M', 'B': 'SK'})
+
+    def test_should_cache_until_atoms_are_edited(self):
+        self.protein.chain_sequences().should.be(self.protein.chain_sequences())
+        self.protein.reassign_chains({'B': 'C'})
+        self.protein.chain_sequence_strings().should.equal({'A': 'M--KDX-G', 'C': 'SW'})
+
+
+class TestPDBTableCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.path = os.path.join(self.directory, 'protein.pdb')
+        with open(self.path, 'w') as f:
+            f.write(PDB_TEXT)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def rewrite_keeping_size_and_mtime(self):
+        stat = os.stat(self.path)
+        with open(self.path, 'w') as f:
+            f.write(PDB_TEXT.replace('ALA', 'GLU'))
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    def test_should_save_and_load_tables(self):
+        table = PDBAtomTable.parse_string(PDB_TEXT)
+        f = BytesIO()
+        table.save(f, source=np.array('test'))
+        f.seek(0)
+        loaded, metadata = PDBAtomTable.load(f)
+        list(format_pdb_records(loaded)).should.equal(list(format_pdb_records(table)))
+        str(metadata['source']).should.equal('test')
+
+    def test_should_reuse_the_cache_of_an_unchanged_file(self):
+        read_pdb_table(self.path, self.cache_dir)
+        os.listdir(self.cache_dir).should.have.length_of(1)
+        self.rewrite_keeping_size_and_mtime()
+        read_pdb_table(self.path, self.cache_dir).resName[0].should.equal('ALA')
+
+    def test_should_reparse_a_changed_file(self):
+        read_pdb_table(self.path, self.cache_dir, use_hash=True)
+        self.rewrite_keeping_size_and_mtime()
+        read_pdb_table(self.path, self.cache_dir, 
+            use_hash=True).resName[0].should.equal('GLU')
+        with open(self.path, 'a') as f:
+            f.write(PDB_TEXT)
+        len(read_pdb_table(self.path, self.cache_dir)).should.equal(10)
+
+
+class TestSelections(unittest.TestCase):
+
+    def setUp(self):
+        self.table = PDBAtomTable.parse_string(PDB_TEXT)
+
+    def test_should_compile_to_masks(self):
+        heavy_chain_a = Selection.chain('A') & ~Selection.hydrogen()
+        assert_array_equal(self.table.mask(heavy_chain_a), [True, True, False, True, False])
+        assert_array_equal(self.table.select(Selection.backbone() | Selection.kind('HETATM')).serial, 
+            [1, 2, 4, 5])
+        assert_array_equal(self.table.select(Selection.resSeq(2, 200)).serial, [4, 5])
+        assert_array_equal(self.table.select(Selection.resSeq(IntervalSet([(1, 1), (101, 101)]))).serial, 
+            [1, 2, 3, 5])
+        len(self.table.select(Selection.name('XX'))).should.equal(0)
+        str(heavy_chain_a).should.equal("(chainID('A') & ~element('H'))")
+
+    def test_should_give_views_of_consecutive_atoms(self):
+        self.table.indices(Selection.resSeq(1)).should.equal(slice(0, 3))
+        selected = self.table.select(Selection.resSeq(1))
+        np.shares_memory(selected.r, self.table.r).should.be.true
+
+    def test_should_evaluate_a_selection_once(self):
+        calls = []
+        heavy = Selection.where(lambda table: calls.append(1) or table.element != 'H', 'heavy', 
+            uses_coordinates=False)
+        self.table.mask(heavy).should.be(self.table.mask(heavy))
+        trajectory = PDBTrajectory(self.table, np.stack([self.table.r] * 3))
+        [len(trajectory.frame(f).select(heavy)) for f in range(3)].should.equal([4, 4, 4])
+        trajectory.select(heavy).coordinates.shape.should.equal((3, 4, 3))
+        calls.should.equal([1])
+
+    def test_should_share_the_masks_of_equal_selections(self):
+        for _ in range(1000):
+            mask = self.table.mask(Selection.chain('A', 'B') & ~Selection.hydrogen())
+        mask.should.be(self.table.mask(~Selection.element('H') & Selection.chain('B', 'A')))
+        len(self.table._selections).should.equal(4)
+        for i in range(1000):
+            self.table.mask(Selection.resSeq(i))
+        len(self.table._selections).should.equal(_KEPT_SELECTIONS)
+
+    def test_should_evaluate_coordinate_selections_per_frame(self):
+        near = Selection.where(lambda table: table.r[:, 0] < 12, 'near')
+        trajectory = PDBTrajectory(self.table, np.stack([self.table.r, self.table.r + 10]))
+        chain_a = Selection.chain('A')
+        assert_array_equal(trajectory.frame(0).mask(near & chain_a), [True, True, True, False, False])
+        assert_array_equal(trajectory.frame(1).mask(near & chain_a), [False] * 5)
+        trajectory.frame(1).mask(chain_a).should.be(trajectory.frame(0).mask(chain_a))
+
+    def test_should_reevaluate_after_edits(self):
+        chain_a = Selection.chain('A')
+        self.table.mask(chain_a).sum().should.equal(4)
+        self.table.reassign_chains({'B': 'A'})
+        self.table.mask(chain_a).sum().should.equal(5)
+
+    def test_should_select_protein_atoms(self):
+        protein = PDBProtein.from_table(self.table)
+        [atom.serial for atom in protein.select_atoms(Selection.name('N'))].should.equal(['1', '4'])
+        protein.rename_atoms({'N': 'N1', 'CA': 'CA', 'H': 'H', 'O': 'O'})
+        protein.select_atoms(Selection.name('N')).should.equal([])
+
+    def test_should_select_protein_atoms_after_edits_of_residues(self):
+        protein = PDBProtein.from_table(self.table)
+        len(protein.select_atoms(Selection.all())).should.equal(5)
+        protein.residues[0].strip_hydrogens()
+        [atom.name for atom in protein.select_atoms(Selection.chain('A'))].should.equal(
+            ['N', 'CA', 'N'])
+        protein.residues[0].atoms[0].set_name('N1')
+        [atom.serial for atom in protein.select_atoms(Selection.name('N'))].should.equal(['4'])
+        protein.residues[0].reorder_by_names(['CA', 'N1'])
+        [atom.serial for atom in protein.select_atoms(Selection.name('CA'))].should.equal(['2'])
+        protein.select_atoms(Selection.name('CA'))[0].should.be(protein.atoms[0])
+
+
+
 class TestPrintAtomLine(unittest.TestCase):
 
     def test_should_return_proper_line(self):
@@ -159,6 +764,95 @@ class TestProtCntctParser(unittest.TestCase):
 
 
 
+PROT_CNTCT_REPORT = """Protein Contacts
+
+    Type   Chain     Pos Residue       Chain     Pos Residue      Net
+1     HB    1:1ORSC_c   8 ALA34.O       1:1ORSC_c  12 SER38.OG       3
+2     HB    1:1ORSC_c   3 LEU13.O       1:1ORSC_c   7 THR17.OG1     16
+3     ION   1:1ORSC_c  20 LYS-2.NZ      2:1ORSC_d   4 ASP108.OD1     1
+"""
+
+
+class TestProtCntctReport(unittest.TestCase):
+
+    def test_should_agree_with_the_line_parser(self):
+        columns = parse_prot_cntct_report(PROT_CNTCT_REPORT)
+        lines = PROT_CNTCT_REPORT.splitlines()[3:]
+        for i, line in enumerate(lines):
+            {column: str(values[i]) for column, values in columns.items()}.should.equal(
+                parse_prot_cntct_line(line))
+        assert_array_equal(columns['pdb_res_dex1'], [34, 13, -2])
+        columns['moe_dex2'].dtype.should.equal(np.int64)
+        assert_array_equal(columns['res_typ2'], ['SER', 'THR', 'ASP'])
+
+    def test_should_read_files_in_chunks(self):
+        report = BytesIO(PROT_CNTCT_REPORT.encode())
+        read_prot_cntct_report(report)['net'].tolist().should.equal([3, 16, 1])
+        chunks = list(iter_prot_cntct_report(StringIO(PROT_CNTCT_REPORT), chunk_size=2))
+        [chunk['line_num'].tolist() for chunk in chunks].should.equal([[1, 2], [3]])
+        list(iter_prot_cntct_report(StringIO('no contacts'))).should.equal([])
+
+    def test_should_reject_malformed_contact_lines(self):
+        parse_prot_cntct_report.when.called_with(
+            PROT_CNTCT_REPORT + '4     HB    1:1ORSC_c   8 ALA34\n').should.throw(
+            ValueError, '4     HB    1:1ORSC_c   8 ALA34 is not a protein contact line.')
+
+    def test_contact_ends_should_parse_residues(self):
+        end = ContactEnd.parse_string('LYS13.NZ')
+        (end.residue_name, end.UID, end.atom_name).should.equal(('LYS', 13, 'NZ'))
+        end.find_name_in_amino_acids(constants.aminoacids).should.equal('1')
+
+
+
+class TestInteractionPairHistogram(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.reports = []
+        for i, lines in enumerate([[3, 4, 5], [3], [5, 5, 4]]):
+            self.reports.append(os.path.join(self.directory, f'{i}.txt'))
+            with open(self.reports[-1], 'w') as f:
+                f.write(''.join(PROT_CNTCT_REPORT.splitlines(True)[j] for j in lines))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_count_like_interresidue_contacts(self):
+        histogram = count_interaction_pairs(self.reports, processes=2)
+        pairs = {}
+        for report in self.reports:
+            with open(report) as f:
+                for line in f:
+                    pair = InterresidueContact(line).interaction_pair_string
+                    pairs[pair] = pairs.get(pair, 0) + 1
+        x, y = histogram.table()
+        dict(zip(x.tolist(), y.tolist())).should.equal(pairs)
+        x.tolist().should.equal(['1 2 ION', '4 5 HB'])
+
+    def test_should_count_only_new_reports(self):
+        histogram = count_interaction_pairs(self.reports[:2], processes=1)
+        histogram.total.should.equal(4)
+        count_interaction_pairs(self.reports, histogram, processes=1).should.be(histogram)
+        histogram.total.should.equal(7)
+        count_interaction_pairs(self.reports, histogram, processes=1).total.should.equal(7)
+
+    def test_should_merge_and_save_histograms(self):
+        first = count_interaction_pairs(self.reports[1:2], processes=1)
+        second = count_interaction_pairs(self.reports[2:], processes=1)
+        first.contact_types.should.equal(('HB',))
+        first.merge(second).contact_types.should.equal(('HB', 'ION'))
+        saved = BytesIO()
+        first.save(saved)
+        saved.seek(0)
+        loaded = InteractionPairHistogram.load(saved)
+        assert_array_equal(loaded.counts, first.counts)
+        loaded.reports.should.equal(frozenset(self.reports[1:]))
+        x, y = loaded.table()
+        union = unionize_2_distros(x, y, *count_interaction_pairs(self.reports[:1], processes=1).table())
+        [a.tolist() for a in union].should.equal([['1 2 ION', '4 5 HB'], [2, 2], [1, 2]])
+
+
+
 class TestFloatList(unittest.TestCase):
 
     def test_correct_floats_from_list_o_str_o_floats(self):
@@ -173,6 +867,20 @@ class TestFloatList(unittest.TestCase):
     def test_correct_abs_if_item_is_complex(self):
         assert_array_equal(float_list(complex(1,1)), array(abs(complex(1,1))))
 
+    def test_same_floats_in_bulk_as_element_by_element(self):
+        strings = [f'{x:12.6f}' for x in np.random.default_rng(0).uniform(-1000, 1000, 10000)]
+        values = strings[:5000] + [' Pi ', 'e', complex(3, 4)] + strings[5000:]
+        expected = [float(x) for x in strings[:5000]] + [pi, e, 5.0] + [float(x) for x in strings[5000:]]
+        assert_array_equal(float_list(values), expected)
+        assert_array_equal(float_list(np.array(strings)), expected[:5000] + expected[5003:])
+        assert_array_equal(float_list(np.array([1+1j, 3+4j])), [abs(1+1j), 5.0])
+        assert_array_equal(float_list((1, '2', 3.5)), [1.0, 2.0, 3.5])
+
+    def test_first_value_not_float_able_raises(self):
+        values = ['1.0'] * 5000 + ['pi', 'x', 'y']
+        float_list.when.called_with(values).should.throw(ValueError, 'x is not float-able.')
+        float_list.when.called_with(['1.0', None]).should.throw(TypeError)
+
 
 
 class TestGetRanges(unittest.TestCase):
@@ -191,6 +899,43 @@ class TestGetRanges(unittest.TestCase):
         
 
 
+class TestIntervalSet(unittest.TestCase):
+
+    def setUp(self):
+        self.ranges = IntervalSet.parse('10:20,1:3,4:6,30:25')
+
+    def test_should_merge_sorted_ranges(self):
+        self.ranges.ranges.should.equal([(1, 6), (10, 20), (25, 30)])
+        len(self.ranges).should.equal(23)
+        assert_array_equal(IntervalSet.parse('1:3,4:6,7:9').values(), 
+            get_ranges(['-range1:3,4:6,7:9']))
+
+    def test_should_test_membership(self):
+        (6 in self.ranges).should.be.true
+        (7 in self.ranges).should.be.false
+        (0 in self.ranges).should.be.false
+        (0 in IntervalSet()).should.be.false
+        assert_array_equal(self.ranges.contains([0, 1, 6, 7, 20, 21, 30, 31]), 
+            [False, True, True, False, True, False, True, False])
+        assert_array_equal(IntervalSet().contains([1, 2]), [False, False])
+
+    def test_should_combine_sets(self):
+        other = IntervalSet([(5, 12), (40, 41)])
+        (self.ranges | other).ranges.should.equal([(1, 20), (25, 30), (40, 41)])
+        (self.ranges & other).ranges.should.equal([(5, 6), (10, 12)])
+        (self.ranges - other).ranges.should.equal([(1, 4), (13, 20), (25, 30)])
+        (other - other).should.equal(IntervalSet())
+        members = set(self.ranges) | set(other)
+        set(self.ranges | other).should.equal(members)
+
+    def test_should_parse_range_options(self):
+        args = ['-range1:3', 'x', '-range5:9,2:4']
+        get_interval_set(args).ranges.should.equal([(1, 9)])
+        args.should.equal(['x'])
+        get_interval_set.when.called_with(['-range1:a']).should.throw(SystemExit, 'Part of 1:a != int')
+
+
+
 class TestUnionOfDistrosGivenX(unittest.TestCase):
  
     def setUp(self):
@@ -230,8 +975,83 @@ class UnionOfTwoDistros(unittest.TestCase):
     def test_gives_correct_y2_union(self):
         self.assertTrue((self.unionizedY2 == self.correctUnionY2).all())
 
+
+def unionize_distro_given_x_by_comparison(cmbn_x, x, y):
+    cmbn_y = np.zeros(len(cmbn_x))
+    for i, j in enumerate(x):
+        cmbn_y[j == cmbn_x] = y[i]
+    return cmbn_y
+
+
+class TestUnionOfManyDistros(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.default_rng(1)
+        self.xs = [random.integers(0, 50, random.integers(0, 30)).astype(float) for _ in range(6)]
+        self.ys = [random.uniform(1, 2, len(x)) for x in self.xs]
+        self.xs[0][:2] = np.nan
+
+    def test_should_agree_with_comparing_every_x(self):
+        cmbn_x = np.concatenate([[np.nan, 7., 7.], np.arange(60.)[::-1]])
+        for x, y in zip(self.xs, self.ys):
+            assert_array_equal(unionize_distro_given_x(cmbn_x, x, y), 
+                unionize_distro_given_x_by_comparison(cmbn_x, x, y))
+
+    def test_should_unionize_all_distros_at_once(self):
+        cmbn_x, cmbn_ys = unionize_distros(self.xs, self.ys)
+        assert_array_equal(cmbn_x, np.unique(np.concatenate(self.xs)))
+        cmbn_ys.shape.should.equal((6, len(cmbn_x)))
+        for x, y, cmbn_y in zip(self.xs, self.ys, cmbn_ys):
+            assert_array_equal(cmbn_y, unionize_distro_given_x_by_comparison(cmbn_x, x, y))
+
+    def test_should_unionize_no_distros(self):
+        cmbn_x, cmbn_ys = unionize_distros([[], []], [[], []])
+        cmbn_ys.shape.should.equal((2, 0))
+
+
  
 
+class TestWritePDB(unittest.TestCase):
+
+    def setUp(self):
+        lines = [PDBAtomLine.parse_string(line) for line in PDB_TEXT.splitlines()]
+        self.lines = [line for line in lines if line]
+        self.table = PDBAtomTable.parse_string(PDB_TEXT)
+
+    def test_records_should_match_print_pdb_ATOM_line(self):
+        expected = [print_pdb_ATOM_line(line.as_dict()) for line in self.lines]
+        list(format_pdb_records(self.table)).should.equal(expected)
+        list(format_pdb_records(PDBProtein(self.lines))).should.equal(expected)
+
+    def test_should_write_ter_after_each_chain(self):
+        f = StringIO()
+        write_pdb(f, self.table, batch_size=2)
+        records = f.getvalue().splitlines()
+        [record[:6] for record in records].should.equal(['ATOM  '] * 4 + 
+            ['TER   ', 'HETATM', 'END'])
+        records[4].should.equal('TER              GLY A   2 ')
+        records[5][6:11].should.equal('    5')
+
+    def test_should_write_the_same_records_in_any_batch_size(self):
+        expected = StringIO()
+        write_pdb(expected, self.table)
+        for structure in (self.table, PDBProtein(self.lines)):
+            for batch_size in range(1, 6):
+                f = StringIO()
+                write_pdb(f, structure, batch_size=batch_size)
+                f.getvalue().should.equal(expected.getvalue())
+
+    def test_should_write_models(self):
+        trajectory = PDBTrajectory.parse_file(StringIO(MULTI_MODEL_PDB_TEXT))
+        f = StringIO()
+        write_pdb(f, trajectory, ter=False)
+        f.getvalue().should.equal(''.join(line.ljust(80) + '\n' 
+            if line.startswith('ATOM') else line + '\n' 
+            for line in MULTI_MODEL_PDB_TEXT.splitlines()))
+
+
+
+
 class ProteinDataBankResolutionSpec(unittest.TestCase):
 
     def test_should_resolve_from_the_web(self):
@@ -246,3 +1066,308 @@ class ProteinDataBankResolutionSpec(unittest.TestCase):
         pdb_rsln.when.called_with('2rh1').should.return_value('2.40')
 
 
+
+class TestResolutionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'misc', 'pdb_rsln.dat')
+        os.makedirs(os.path.dirname(self.db_path))
+        with open(self.db_path, 'w') as f:
+            f.write('2RH1 N/F\n1ABC 1.50\n2RH1 2.40\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_should_take_the_latest_resolution_of_an_id(self):
+        pdb_rsln('2rh1', db_path=self.db_path).should.equal('2.40')
+
+    def test_should_look_up_many_ids(self):
+        pdb_rsln_many(['1abc', '2RH1A', '1ABC'], db_path=self.db_path).should.equal(
+            ['1.50', '2.40', '1.50'])
+
+    def test_should_read_lines_appended_since_it_was_loaded(self):
+        store = resolution_store(self.db_path)
+        store.get('1ABC').should.equal('1.50')
+        with open(self.db_path, 'a') as f:
+            f.write('3XYZ 3.10\n4XYZ')
+        store.get('3XYZ').should.equal('3.10')
+        store.get('4XYZ').should.be.none
+        with open(self.db_path, 'a') as f:
+            f.write(' 2.00\n')
+        store.get('4XYZ').should.equal('2.00')
+        store.add({'5XYZ': '1.90'})
+        resolution_store(self.db_path).get_many(['5XYZ', '1ABC']).should.equal(
+            ['1.90', '1.50'])
+
+
+
+class FakeStructurePages(BaseHTTPRequestHandler):
+
+    pages = {
+        '/structure/2RH1': '<html><body><div id="exp_header_0_resolution">'
+            'Resolution: 2.40 &Aring;</div></body></html>',
+        '/structure/1NMR': '<html><body><div id="exp_header_0_method">'
+            'SOLUTION NMR</div></body></html>',
+        '/structure/3SLO': '<html><body><div id="exp_header_0_resolution">'
+            'Resolution: 3.10 &Aring;</div></body></html>',
+        '/structure/4LDE': '<html><body><div id="exp_header_0_resolution">'
+            'Resolution: 2.79 &Aring;</div></body></html>',
+    }
+    entries = {
+        '/entry/2RH1': '{"rcsb_entry_info": {"resolution_combined": [2.4]}}',
+        '/entry/1NMR': '{"rcsb_entry_info": {"resolution_combined": null}}',
+    }
+    unavailable = {'/structure/3SLO': 1}
+    rate_limited = {'/structure/4LDE': 2}
+
+    def do_GET(self):
+        requests_seen = self.server.requests_seen
+        requests_seen[self.path] = requests_seen.get(self.path, 0) + 1
+        if requests_seen[self.path] <= self.unavailable.get(self.path, 0):
+            self.send_response(503)
+            self.end_headers()
+            return
+        if requests_seen[self.path] <= self.rate_limited.get(self.path, 0):
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        content_type = 'application/json' if self.path in self.entries else 'text/html; charset=utf-8'
+        page = self.pages.get(self.path, self.entries.get(self.path))
+        if page is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = page.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetchPDBResolutions(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeStructurePages)
+        self.server.requests_seen = {}
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/structure/'
+        self.directory = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.directory, 'pdb_rsln.dat')
+        open(self.db_path, 'w').close()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def fetch(self, pdbids, backoff=0.01, **options):
+        return fetch_pdb_resolutions(pdbids, base_url=self.base_url, backoff=backoff, 
+            db_path=self.db_path, **options)
+
+    def test_should_fetch_resolutions_concurrently(self):
+        self.fetch(['2rh1', '1NMR', '9XXX', '2RH1'], concurrency=3).should.equal(
+            {'2RH1': '2.40', '1NMR': 'N/F', '9XXX': 'N/F'})
+        self.server.requests_seen['/structure/2RH1'].should.equal(1)
+
+    def test_should_retry_server_errors(self):
+        self.fetch(['3SLO']).should.equal({'3SLO': '3.10'})
+        self.server.requests_seen['/structure/3SLO'].should.equal(2)
+
+    def test_should_retry_when_rate_limited(self):
+        started = time.perf_counter()
+        self.fetch(['4LDE'], backoff=10).should.equal({'4LDE': '2.79'})
+        self.server.requests_seen['/structure/4LDE'].should.equal(3)
+        # waits what Retry-After asks rather than the backoff
+        (time.perf_counter() - started).should.be.lower_than(5)
+
+    def test_should_give_up_after_the_retries(self):
+        self.fetch(['3SLO'], retries=0).should.equal({'3SLO': 'N/F'})
+
+    def test_should_store_what_it_fetched(self):
+        self.fetch(['2RH1'])
+        resolution_store(self.db_path).get('2RH1').should.equal('2.40')
+        pdb_rsln_many(['2RH1', '3SLO'], db_path=self.db_path, base_url=self.base_url, 
+            backoff=0.01).should.equal(['2.40', '3.10'])
+        self.server.requests_seen['/structure/2RH1'].should.equal(1)
+
+    def test_should_read_json_entries(self):
+        entry_url = self.base_url.replace('/structure/', '/entry/')
+        fetch_pdb_resolutions(['2RH1', '1NMR'], base_url=entry_url, db_path=None).should.equal(
+            {'2RH1': '2.40', '1NMR': 'N/F'})
+
+
+class TestResolutionExtraction(unittest.TestCase):
+
+    page = (b'<html><head><title>2RH1</title></head><body><ul>'
+        b'<li id="exp_header_0_method"><strong>Method:</strong> X-RAY 1.5</li>'
+        b'<li id="exp_header_0_resolution"><strong>Resolution:</strong>&nbsp;2.40 '
+        b'&Aring;</li></ul>' + b'<p>filler 9.99</p>' * 1000 + b'</body></html>')
+
+    def chunks(self, page, size):
+        self.taken = 0
+        for i in range(0, len(page), size):
+            self.taken += 1
+            yield page[i:i + size]
+
+    def test_should_agree_with_the_page_parser(self):
+        for size in [1, 7, 64, len(self.page)]:
+            _resolution_from_chunks(self.chunks(self.page, size)).should.equal(
+                _resolution_from_page(self.page.decode()))
+
+    def test_should_stop_at_the_resolution(self):
+        _resolution_from_chunks(self.chunks(self.page, 64))
+        self.taken.should.be.lower_than(10)
+
+    def test_should_not_find_a_missing_resolution(self):
+        page = self.page.replace(b'exp_header_0_resolution', b'exp_header_0_weight')
+        _resolution_from_chunks(self.chunks(page, 64)).should.equal('N/F')
+
+    def test_should_parse_an_unclosed_element(self):
+        page = b'<div><span id="exp_header_0_resolution">Resolution: 3.10'
+        _resolution_from_chunks(self.chunks(page, 5)).should.equal('3.10')
+
+
+def gpcrdb_residue(sequence_number, amino_acid, protein_segment, bw=None):
+    return {'sequence_number': sequence_number, 'amino_acid': amino_acid, 
+        'protein_segment': protein_segment, 'alternative_generic_numbers': 
+        [{'scheme': 'BW', 'label': bw}, {'scheme': 'GPCRdb(A)', 'label': 'x'}] if bw else []}
+
+
+GPCRDB_RESIDUES = [
+    gpcrdb_residue(130, 'D', 'TM3', '3.49'),
+    gpcrdb_residue(131, 'R', 'TM3', '3.50'),
+    gpcrdb_residue(140, 'K', 'ICL2'),
+    gpcrdb_residue(132, 'Y', 'TM3', '3.51'),
+]
+
+
+class TestReceptorIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.receptor = Receptor('adrb2_human', GPCRDB_RESIDUES)
+
+    def test_should_find_residues_by_index(self):
+        self.receptor.residue_for_index('ARG131').bw.should.equal('3.50')
+        self.receptor.residue_for_index('R131').abbr_seq_num.should.equal('ARG131')
+        self.receptor.residue_for_index('131').abbr_seq_num.should.equal('ARG131')
+        self.receptor.residue_for_index('X0131').should.be.none
+        self.receptor.residue_for_index('R999').should.be.none
+
+    def test_should_find_residues_by_label_and_segment(self):
+        self.receptor.residue_for_bw('3.51').abbr_seq_num.should.equal('TYR132')
+        self.receptor.residue_for_sequence_number(140).protein_segment.should.equal('ICL2')
+        [r.sequence_number for r in self.receptor.residues_in_segment('TM3')].should.equal(
+            [130, 131, 132])
+        [r.sequence_number for r in self.receptor.residues_in_helix(3)].should.equal(
+            [130, 131, 132])
+        self.receptor.residues_in_segment('TM7').should.equal(())
+
+    def test_should_find_many_residues_at_once(self):
+        residues = self.receptor.residues_for_indices([132, 7, 130, 140, 999])
+        [r and r.sequence_number for r in residues].should.equal([132, None, 130, 140, None])
+        residues = self.receptor.residues_for_indices(['R131', 'LYS140', 'R131', 'Q5'])
+        [r and r.sequence_number for r in residues].should.equal([131, 140, 131, None])
+
+
+class FakeGPCRDB(BaseHTTPRequestHandler):
+
+    receptors = {'/services/residues/extended/adrb2_human': GPCRDB_RESIDUES,
+        '/services/residues/extended/oprm_human': GPCRDB_RESIDUES[:2]}
+
+    def do_GET(self):
+        requests_seen = self.server.requests_seen
+        requests_seen[self.path] = requests_seen.get(self.path, 0) + 1
+        if self.path not in self.receptors:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = json.dumps(self.receptors[self.path]).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestLoadReceptors(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGPCRDB)
+        self.server.requests_seen = {}
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.options = {'cache_dir': tempfile.mkdtemp(), 'base_url': 
+            f'http://127.0.0.1:{self.server.server_address[1]}/services/residues/extended/'}
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.options['cache_dir'])
+
+    def test_should_fetch_each_receptor_once(self):
+        receptors = load_receptors(['adrb2_human', 'oprm_human', 'adrb2_human'], **self.options)
+        sorted(receptors).should.equal(['adrb2_human', 'oprm_human'])
+        receptors['adrb2_human'].residue_for_bw('3.51').abbr_seq_num.should.equal('TYR132')
+        len(receptors['oprm_human'].residues).should.equal(2)
+        load_receptors(['oprm_human'], **self.options)
+        Receptor('adrb2_human', cache_dir=self.options['cache_dir'])
+        sorted(self.server.requests_seen.values()).should.equal([1, 1])
+
+    def test_should_load_receptors_from_the_disk_cache(self):
+        load_receptors(['adrb2_human'], **self.options)
+        self.server.server_close()
+        self.server.shutdown()
+        constants._receptor_residues.clear()
+        receptor = load_receptors(['adrb2_human'], **self.options)['adrb2_human']
+        [(r.abbr_seq_num, r.protein_segment, r.bw) for r in receptor.residues_in_segment('TM3')].should.equal(
+            [('ASP130', 'TM3', '3.49'), ('ARG131', 'TM3', '3.50'), ('TYR132', 'TM3', '3.51')])
+        receptor.residue_for_index('K140').bw.should.be.none
+
+    def test_should_convert_cached_json_responses(self):
+        with open(os.path.join(self.options['cache_dir'], 'oprm_human.json'), 'w') as fp:
+            json.dump(GPCRDB_RESIDUES[2:], fp)
+        receptor = load_receptors(['oprm_human'], **self.options)['oprm_human']
+        sorted(receptor.residues).should.equal(['LYS140', 'TYR132'])
+        self.server.requests_seen.should.equal({})
+
+    def test_should_fail_for_unknown_receptors(self):
+        load_receptors.when.called_with(['nope_human'], **self.options).should.throw(
+            requests.HTTPError)
+
+
+class TestAminoAcidCodes(unittest.TestCase):
+
+    def test_should_agree_with_the_amino_acid_objects(self):
+        abbrs = [acid.abbr for acid in AminoAcid._all_values]
+        codes = amino_acid_codes(abbrs)
+        assert_array_equal(amino_acid_abbrs[codes], abbrs)
+        assert_array_equal(amino_acid_letters_of(abbrs), 
+            [AminoAcid.by_abbr(abbr).letter for abbr in abbrs])
+        assert_array_equal(amino_acid_groups_of(abbrs), 
+            [AminoAcid.by_abbr(abbr).group for abbr in abbrs])
+        [AminoAcid.by_code(code).abbr for code in codes].should.equal(abbrs)
+
+    def test_should_translate_letters_lower_case_and_unknown_names(self):
+        names = np.array([['TRP', 'w', 'HOH'], ['gly', 'G', '']])
+        assert_array_equal(amino_acid_letters_of(names), [['W', 'W', 'X'], ['G', 'G', 'X']])
+        amino_acid_codes(['ZZZ'])[0].should.equal(UNKNOWN_AMINO_ACID)
+        amino_acid_groups_of([]).shape.should.equal((0,))
+
+    def test_should_find_contact_ends_in_the_amino_acid_table(self):
+        end = ContactEnd('LYS', 13, 'NZ')
+        end.find_name_in_amino_acids(constants.aminoacids).should.equal('1')
+        end.find_name_in_amino_acids(constants.aminoacids[::-1]).should.equal('1')
+        ContactEnd('HOH', 13, 'O').find_name_in_amino_acids.when.called_with(
+            constants.aminoacids).should.throw(LookupError)
+        for name in ('A', 'ala', 'Lys'):
+            for aminoacids in (constants.aminoacids, constants.aminoacids.copy()):
+                ContactEnd(name, 13, 'CA').find_name_in_amino_acids.when.called_with(
+                    aminoacids).should.throw(LookupError)